@@ -0,0 +1,118 @@
+"""Benchmark: Bot API request backends against the local fake Bot API.
+
+    python bench_http.py [--calls 2000] [--concurrency 64] [--latency 0.02]
+    python bench_http.py --base-url http://127.0.0.1:8081/bot   # an already running Bot API server
+
+Each configuration sends the same burst of sendMessage calls while a getUpdates long
+poll runs in the background, the way the bot uses its connections while polling. The
+baseline is what Application.builder() sets up when the bot passes no requests.
+HTTP/2 is only benchmarked with --base-url pointing at a server that speaks it and
+with the h2 package installed.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+
+# bot.py reads its configuration at import time
+os.environ.setdefault("BOT_TOKEN", "123:bench")
+os.environ.setdefault("STORE_PATH", ":memory:")
+
+from telegram import Bot
+from telegram.error import TelegramError
+from telegram.request import HTTPXRequest
+
+import bot
+import fake_telegram
+
+
+def configurations(http2: bool) -> list:
+    """(name, calls request, get_updates request)"""
+    configs = [
+        # What Application.builder() builds when no request is given: 256 connections, 1 for polling
+        ("Application.builder() defaults",
+         HTTPXRequest(connection_pool_size=256), HTTPXRequest(connection_pool_size=1)),
+        (f"pool {bot.HTTP_POOL_SIZE}, no keep-alive",
+         bot.make_request(bot.HTTP_POOL_SIZE, keepalive_connections=0), bot.make_request(bot.GET_UPDATES_POOL_SIZE)),
+        (f"pool {bot.HTTP_POOL_SIZE}, keep-alive (bot.py)",
+         bot.make_request(bot.HTTP_POOL_SIZE), bot.make_request(bot.GET_UPDATES_POOL_SIZE)),
+    ]
+    if http2:
+        configs.append((f"pool {bot.HTTP_POOL_SIZE}, HTTP/2",
+                        bot.make_request(bot.HTTP_POOL_SIZE, http_version="2"), bot.make_request(bot.GET_UPDATES_POOL_SIZE)))
+    return configs
+
+
+async def long_poll(telegram_bot: Bot, stop: asyncio.Event):
+    while not stop.is_set():
+        try:
+            await telegram_bot.get_updates(timeout=2)
+        except TelegramError:
+            await asyncio.sleep(0.1)
+
+
+async def run(base_url: str, name: str, request, get_updates_request, calls: int, concurrency: int):
+    telegram_bot = Bot("123:bench", base_url=base_url, request=request, get_updates_request=get_updates_request)
+    await telegram_bot.initialize()
+    stop = asyncio.Event()
+    poller = asyncio.create_task(long_poll(telegram_bot, stop))
+    await asyncio.sleep(0.2)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = Counter()
+
+    async def call(i):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await telegram_bot.send_message(chat_id=10_000 + i % 500, text="benchmark")
+            except TelegramError as e:
+                errors[type(e).__name__] += 1
+                return
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(call(i) for i in range(calls)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await poller
+    await telegram_bot.shutdown()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+    print(f"{name:<42} {len(latencies) / elapsed:8.0f} calls/s   p50 {p50:7.1f} ms   p99 {p99:7.1f} ms   errors {dict(errors) or 0}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=bot.UPDATE_CONCURRENCY)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the stub takes per call")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--base-url", help="benchmark this Bot API server instead of starting the stub")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    base_url = args.base_url
+    if not base_url:
+        api = fake_telegram.FakeBotAPI(latency=args.latency)
+        fake_telegram.serve(api, port=args.port)
+        base_url = f"http://127.0.0.1:{args.port}/bot"
+    try:
+        import h2  # noqa: F401
+        http2 = bool(args.base_url)
+    except ImportError:
+        http2 = False
+
+    print(f"{args.calls} sendMessage calls, {args.concurrency} at a time, against {base_url}")
+    for name, request, get_updates_request in configurations(http2):
+        await run(base_url, name, request, get_updates_request, args.calls, args.concurrency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+"""Benchmark: event-loop stalls caused by logging during an error storm.
+
+    python bench_logging.py [--errors 5000] [--write-latency 0.0002]
+
+Each configuration logs the same burst of handler errors (with traceback and the
+offending Update) the way error_handler does, while a ticker task measures how late
+the event loop wakes it up. --write-latency makes every write to the log stream take
+that long, like stderr piped into a busy log shipper.
+"""
+import argparse
+import asyncio
+import logging
+import tempfile
+import time
+
+from telegram import Update
+
+import fake_telegram
+from logsetup import TEXT_FORMAT, LogPipeline, TextFormatter, Truncated
+
+logger = logging.getLogger("bench")
+
+
+class SlowStream:
+    """A file whose every write takes at least latency seconds."""
+
+    def __init__(self, f, latency: float):
+        self.f = f
+        self.latency = latency
+        self.lines = 0
+
+    def write(self, text):
+        if self.latency:
+            time.sleep(self.latency)
+        self.lines += text.count("\n")
+        return self.f.write(text)
+
+    def flush(self):
+        self.f.flush()
+
+
+def direct(stream):
+    """The old setup: basicConfig's StreamHandler writing on the caller's thread."""
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(TextFormatter(TEXT_FORMAT))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    return lambda: root.removeHandler(handler)
+
+
+def pipeline(stream, sample_burst: int):
+    log_pipeline = LogPipeline("INFO", "json", sample_burst, 60, 10000, stream)
+    log_pipeline.start()
+    return log_pipeline.stop
+
+
+def log_eager(update, error):
+    logger.error(f'Update {update} caused error {error}', exc_info=error)
+
+
+def log_lazy(update, error):
+    logger.error("Update %s caused error %s", Truncated(update, 1000), error,
+                 exc_info=error, extra={"update_id": update.update_id})
+
+
+CONFIGURATIONS = [
+    ("basicConfig, f-string, full update", lambda stream: direct(stream), log_eager),
+    ("basicConfig, lazy, truncated update", lambda stream: direct(stream), log_lazy),
+    ("queue + json, no sampling", lambda stream: pipeline(stream, 0), log_lazy),
+    ("queue + json, sampled 10/min", lambda stream: pipeline(stream, 10), log_lazy),
+]
+
+
+def failing_call(depth: int):
+    if depth:
+        failing_call(depth - 1)
+    raise ConnectionError("Bot API unreachable")
+
+
+async def ticker(lags: list, stop: asyncio.Event, interval: float = 0.001):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        due = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - due))
+
+
+async def run(name, setup, log, update, errors: int, write_latency: float):
+    with tempfile.TemporaryFile("w") as f:
+        stream = SlowStream(f, write_latency)
+        teardown = setup(stream)
+        lags, stop = [], asyncio.Event()
+        monitor = asyncio.create_task(ticker(lags, stop))
+        await asyncio.sleep(0.05)
+
+        started = time.perf_counter()
+        for i in range(errors):
+            try:
+                failing_call(5)
+            except ConnectionError as e:
+                log(update, e)
+            if i % 10 == 0:
+                await asyncio.sleep(0)
+        elapsed = time.perf_counter() - started
+
+        stop.set()
+        await monitor
+        teardown()
+        drained = time.perf_counter() - started
+
+    lags.sort()
+    stalled = sum(lag for lag in lags if lag > 0.005)
+    print(f"{name:<38} {errors / elapsed:8.0f} logs/s   loop stalled {stalled * 1000:8.1f} ms   "
+          f"max lag {lags[-1] * 1000:6.1f} ms   p99 lag {lags[int(len(lags) * 0.99)] * 1000:6.1f} ms   "
+          f"{stream.lines:6d} lines, written out after {drained:.2f}s")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--errors", type=int, default=5000)
+    parser.add_argument("--write-latency", type=float, default=0.0002, help="seconds each write to the log stream takes")
+    args = parser.parse_args()
+
+    update = Update.de_json(fake_telegram.make_users_shared_update(1, 42, list(range(1, 11))), None)
+    print(f"{args.errors} handler errors, {args.write_latency * 1000:g} ms per write")
+    for name, setup, log in CONFIGURATIONS:
+        await run(name, setup, log, update, args.errors, args.write_latency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,149 @@
+"""Micro-benchmark: precompiled templates vs. the per-message f-strings they replaced.
+
+    python bench_templates.py [--number 200000]
+"""
+import argparse
+import timeit
+
+import templates
+from templates import DEVELOPER, UPDATE_CHANNEL, SUPPORT_GROUP
+
+
+class FakeUser:
+    id = 123456789
+    first_name = "Ann <admin>"
+    last_name = None
+    username = "ann"
+    is_bot = False
+    is_premium = True
+    language_code = "en"
+
+
+class FakeChat:
+    id = -1001234567890
+    title = "News & Updates"
+    username = "news"
+
+
+user = FakeUser()
+chat = FakeChat()
+
+
+def fstring_own_user():
+    return f"""
+<b>👤 Your Information:</b>
+
+<b>Your ID:</b> <code>{user.id}</code>
+<b>First Name:</b> {user.first_name}
+<b>Last Name:</b> {user.last_name or 'None'}
+<b>Username:</b> @{user.username if user.username else 'None'}
+<b>Is Bot:</b> {'Yes ✅' if user.is_bot else 'No ❌'}
+<b>Is Premium:</b> {'Yes ⭐' if user.is_premium else 'No'}
+<b>Language:</b> {user.language_code or 'Unknown'}
+
+<i>💡 Tip: Use the keyboard buttons to select users and chats!</i>
+
+<b>Developer:</b> {DEVELOPER}
+"""
+
+
+def template_own_user():
+    return templates.OWN_USER.render(
+        user_id=user.id,
+        first_name=user.first_name,
+        last_name=user.last_name or 'None',
+        username=user.username or 'None',
+        is_bot='Yes ✅' if user.is_bot else 'No ❌',
+        is_premium='Yes ⭐' if user.is_premium else 'No',
+        language=user.language_code or 'Unknown',
+    )
+
+
+def fstring_shared_chat():
+    return f"""
+<b>📢 Channel Information:</b>
+
+<b>Chat ID:</b> <code>{chat.id}</code>
+<b>Title:</b> {chat.title}
+<b>Username:</b> @{chat.username if chat.username else 'None'}
+<b>Type:</b> Channel
+
+<i>Shared by: {user.first_name} (<code>{user.id}</code>)</i>
+
+<b>Developer:</b> {DEVELOPER}
+"""
+
+
+def template_shared_chat():
+    return templates.SHARED_CHAT.render(
+        emoji="📢",
+        type_name="Channel",
+        chat_id=chat.id,
+        title=chat.title,
+        username=chat.username or 'None',
+        sharer_name=user.first_name,
+        sharer_id=user.id,
+    )
+
+
+def fstring_help():
+    return f"""
+<b>🔍 How to use this bot:</b>
+
+<b>1️⃣ Get User ID:</b>
+• Click "👤 User" button and select any user
+• Click "⭐ Premium" button to select premium users
+• Click "🤖 Bot" button to select bots
+
+<b>2️⃣ Get Chat ID:</b>
+• Click "👥 Group" button and select any group
+• Click "📢 Channel" button and select any channel
+• Click "💬 Forum" button and select any forum
+
+<b>3️⃣ Get Your Chats:</b>
+• Click "👥 My Group" for groups where you're admin
+• Click "📢 My Channel" for channels where you're admin
+• Click "💬 My Forum" for forums where you're admin
+
+<b>4️⃣ Commands:</b>
+/start - Start bot & show main menu
+/help - Show this help
+/id - Get your ID
+
+<b>💡 Tips:</b>
+✅ Use the keyboard buttons to select chats
+✅ You can also forward messages to get IDs
+✅ Share contacts to get user IDs
+
+<b>Developer:</b> {DEVELOPER}
+<b>Update Channel:</b> {UPDATE_CHANNEL}
+<b>Support Group:</b> {SUPPORT_GROUP}
+"""
+
+
+def template_help():
+    return templates.HELP
+
+
+CASES = [
+    ("own user info", fstring_own_user, template_own_user),
+    ("shared chat info", fstring_shared_chat, template_shared_chat),
+    ("help (static)", fstring_help, template_help),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=200_000)
+    args = parser.parse_args()
+
+    print(f"{'layout':<20} {'f-string':>12} {'template':>12} {'ratio':>8}")
+    for name, fstring, template in CASES:
+        old = min(timeit.repeat(fstring, number=args.number, repeat=3)) / args.number
+        new = min(timeit.repeat(template, number=args.number, repeat=3)) / args.number
+        print(f"{name:<20} {old * 1e9:>10.0f}ns {new * 1e9:>10.0f}ns {new / old:>7.2f}x")
+    print("Note: the template path also HTML-escapes every field; the f-strings did not.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,82 +1,593 @@
+# Startup phases are timed from here (see STARTUP_PROFILE)
+from startup import StartupTimer, import_profile
+startup_timer = StartupTimer()
+
 import os
+import re
+import signal
+import asyncio
 import logging
+import functools
+import time
+import httpx
 # 🚨 FIX: Added KeyboardButtonRequestUsers and KeyboardButtonRequestChat to the import list
 from telegram import (
     Update, KeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove, 
     InlineKeyboardButton, InlineKeyboardMarkup, ChatAdministratorRights,
-    KeyboardButtonRequestChat, KeyboardButtonRequestUsers 
+    KeyboardButtonRequestChat, KeyboardButtonRequestUsers,
+    InlineQueryResultArticle, InputTextMessageContent, InlineQueryResultsButton, LinkPreviewOptions
 )
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
-from telegram.constants import ParseMode, ChatType
-from telegram.error import TelegramError
-from dotenv import load_dotenv
-
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+from telegram.ext import (
+    Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler, ChatMemberHandler,
+    InlineQueryHandler
 )
+from telegram.constants import ParseMode, ChatType, MessageOriginType
+from telegram.error import TelegramError, BadRequest, NetworkError, RetryAfter
+from typing import TYPE_CHECKING, NamedTuple, Optional
+from cache import TTLCache, SharedTTLCache, SingleFlight
+from processing import OrderedUpdateProcessor, UpdateTypeGate, required_update_types
+from ratelimit import FloodLimiter, PRIORITY_NOTICE
+import templates
+from storage import Store
+from membership import MembershipIndex, is_member_status
+from grouppolicy import GroupPolicy, is_addressed_to
+from keyboard import KeyboardTracker
+from enrichment import EnrichmentJob, EnrichmentQueue
+from floodguard import FloodGuard
+from logsetup import LogPipeline, Truncated
+import metrics
+from breaker import CircuitBreaker, CircuitOpenError
+# multiprocessing and sharding are only imported in sharded mode (BOT_SHARDS > 1)
+if TYPE_CHECKING:
+    from sharding import ShardRouter
+
+startup_timer.mark("imports")
+
+# Variables from a .env file next to bot.py; python-dotenv is only imported when there is one
+DOTENV_PATH = os.getenv("DOTENV_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
+if os.path.isfile(DOTENV_PATH):
+    from dotenv import load_dotenv
+    load_dotenv(DOTENV_PATH)
+
+# Logging: LOG_FORMAT=json (one object per line) or text. Each logging call site writes at most LOG_SAMPLE_BURST
+# records per LOG_SAMPLE_INTERVAL seconds (0 disables sampling). Records are written by a background thread;
+# with LOG_QUEUE_SIZE records waiting, new ones are dropped instead of holding up the bot. Error logs include
+# at most LOG_UPDATE_MAX_CHARS characters of the update's JSON.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "10"))
+LOG_SAMPLE_INTERVAL = float(os.getenv("LOG_SAMPLE_INTERVAL", "60"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_UPDATE_MAX_CHARS = int(os.getenv("LOG_UPDATE_MAX_CHARS", "1000"))
+
+log_pipeline = LogPipeline(LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_BURST, LOG_SAMPLE_INTERVAL, LOG_QUEUE_SIZE)
+log_pipeline.start()
 logger = logging.getLogger(__name__)
 
-load_dotenv()
-
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 if not BOT_TOKEN:
     logger.error("❌ Error: BOT_TOKEN not found in environment variables!")
     exit()
     
-DEVELOPER = "@Zeroboy216"
-UPDATE_CHANNEL = "https://t.me/zerodevbro"
-SUPPORT_GROUP = "https://t.me/zerodevsupport1"
-
 # --- FORCE SUB CONFIGURATION ---
 MAIN_CHANNEL_ID = "@zerodevbro"
 FORCE_SUB_IMAGE_URL = "https://envs.sh/xCy.jpg"
-CHANNEL_LINK = UPDATE_CHANNEL
+# Optional local copy of the image, uploaded if Telegram cannot fetch the URL (none is bundled)
+FORCE_SUB_IMAGE_PATH = os.getenv("FORCE_SUB_IMAGE_PATH")
+CHANNEL_LINK = templates.UPDATE_CHANNEL
+FORCE_SUB_TEXT = templates.FORCE_SUB.render(channel=MAIN_CHANNEL_ID)
+
+# Membership results are cached: members for minutes, non-members only for seconds
+# so that a user who just joined is not locked out for long.
+SUB_CACHE_SIZE = int(os.getenv("SUB_CACHE_SIZE", "50000"))
+SUB_CACHE_TTL = float(os.getenv("SUB_CACHE_TTL", "300"))
+SUB_CACHE_NEGATIVE_TTL = float(os.getenv("SUB_CACHE_NEGATIVE_TTL", "10"))
+
+# While get_chat_member is failing, users are let through (as before) and that answer is cached for
+# SUB_CACHE_ERROR_TTL seconds. After SUB_BREAKER_FAILURES consecutive network/server errors the check
+# is skipped entirely for SUB_BREAKER_COOLDOWN seconds, then SUB_BREAKER_PROBES calls must succeed
+# before it is trusted again.
+SUB_CACHE_ERROR_TTL = float(os.getenv("SUB_CACHE_ERROR_TTL", "15"))
+SUB_BREAKER_FAILURES = int(os.getenv("SUB_BREAKER_FAILURES", "5"))
+SUB_BREAKER_COOLDOWN = float(os.getenv("SUB_BREAKER_COOLDOWN", "30"))
+SUB_BREAKER_PROBES = int(os.getenv("SUB_BREAKER_PROBES", "2"))
+
+# Join/leave events of MAIN_CHANNEL_ID (the bot must be an admin there) keep a local membership index.
+# Entries older than MEMBERSHIP_MAX_AGE are re-verified in batches every MEMBERSHIP_RECONCILE_INTERVAL seconds.
+MEMBERSHIP_INDEX_SIZE = int(os.getenv("MEMBERSHIP_INDEX_SIZE", "200000"))
+MEMBERSHIP_MAX_AGE = float(os.getenv("MEMBERSHIP_MAX_AGE", "21600"))
+MEMBERSHIP_RECONCILE_INTERVAL = float(os.getenv("MEMBERSHIP_RECONCILE_INTERVAL", "60"))
+MEMBERSHIP_RECONCILE_BATCH = int(os.getenv("MEMBERSHIP_RECONCILE_BATCH", "20"))
+
+# Compact chat/user metadata, filled from get_chat and from data already present in updates
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", "100000"))
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", "3600"))
+
+# Inline mode (enable it for the bot in @BotFather): each user's INLINE_RECENT_LIMIT most recently
+# shared/forwarded chats are kept in memory, and Telegram caches each answer for INLINE_CACHE_TIME seconds.
+INLINE_RECENT_USERS = int(os.getenv("INLINE_RECENT_USERS", "50000"))
+INLINE_RECENT_LIMIT = int(os.getenv("INLINE_RECENT_LIMIT", "20"))
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "30"))
+
+# Admins (comma-separated user ids) can paste up to BULK_RESOLVE_LIMIT @usernames or t.me links and get
+# all their IDs back. BULK_RESOLVE_CONCURRENCY lookups run at once; results are edited into pages of
+# BULK_PAGE_SIZE rows at most every BULK_EDIT_INTERVAL seconds.
+ADMIN_IDS = {int(admin_id) for admin_id in os.getenv("ADMIN_IDS", "").replace(",", " ").split()}
+BULK_RESOLVE_LIMIT = int(os.getenv("BULK_RESOLVE_LIMIT", "50"))
+BULK_RESOLVE_CONCURRENCY = int(os.getenv("BULK_RESOLVE_CONCURRENCY", "5"))
+BULK_PAGE_SIZE = int(os.getenv("BULK_PAGE_SIZE", "20"))
+BULK_EDIT_INTERVAL = float(os.getenv("BULK_EDIT_INTERVAL", "1.5"))
+
+# Shared users/chats are answered at once with what the update carries; missing details are looked up
+# in the background (ENRICH_CONCURRENCY get_chat calls at once, ENRICH_BATCH_SIZE replies per job run)
+# and edited into the reply. Beyond ENRICH_MAX_PENDING waiting replies, new ones keep the bare IDs.
+ENRICH_CONCURRENCY = int(os.getenv("ENRICH_CONCURRENCY", "5"))
+ENRICH_BATCH_SIZE = int(os.getenv("ENRICH_BATCH_SIZE", "20"))
+ENRICH_MAX_PENDING = int(os.getenv("ENRICH_MAX_PENDING", "1000"))
+
+# In groups the bot only answers /id, mentions and replies to it. Each chat then gets at most one answer
+# per GROUP_REPLY_COOLDOWN seconds, and the same user's info is not repeated within GROUP_DEDUP_WINDOW.
+# Group senders are only checked against the force-sub channel with GROUP_FORCE_SUB=true.
+GROUP_REPLY_COOLDOWN = float(os.getenv("GROUP_REPLY_COOLDOWN", "30"))
+GROUP_DEDUP_WINDOW = float(os.getenv("GROUP_DEDUP_WINDOW", "300"))
+GROUP_FORCE_SUB = os.getenv("GROUP_FORCE_SUB", "false").lower() in ("1", "true", "yes")
+
+# Telegram keeps the reply keyboard on screen, so replies only attach it when a chat is not known to show it
+# (/start, /help and a confirmed subscription always do). Every KEYBOARD_RESEND_AFTER seconds a chat gets it again.
+KEYBOARD_RESEND_AFTER = float(os.getenv("KEYBOARD_RESEND_AFTER", "86400"))
+
+# SQLite file for subscription results, chat metadata, usage counters and the force-sub file_id.
+# Writes are buffered and flushed every STORE_FLUSH_INTERVAL seconds.
+STORE_PATH = os.getenv("STORE_PATH", "bot.db")
+STORE_FLUSH_INTERVAL = float(os.getenv("STORE_FLUSH_INTERVAL", "5"))
 # -------------------------------
 
-# --- Performance Optimization: Create Keyboard as a Global Constant ---
+# --- DEPLOYMENT CONFIGURATION ---
+# BOT_MODE=webhook serves updates over HTTPS instead of long polling.
+# WEBHOOK_URL is the public base URL Telegram should call; WEBHOOK_PATH is appended to it.
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", os.getenv("PORT", "8443")))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram").strip("/")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+if BOT_MODE == "webhook" and not WEBHOOK_URL:
+    # Without it PTB would register http://<WEBHOOK_LISTEN>:<port>/... with Telegram, which setWebhook rejects
+    logger.error("❌ Error: BOT_MODE=webhook needs WEBHOOK_URL, the public base URL Telegram should call!")
+    exit(1)
+
+# Updates that piled up while the bot was down are handled after a restart as long as they are at most
+# UPDATE_MAX_AGE seconds old; older messages and member updates are skipped. 0 drops the whole backlog on start.
+UPDATE_MAX_AGE = float(os.getenv("UPDATE_MAX_AGE", "600"))
+
+# STARTUP_PROFILE=1 starts the bot without receiving updates, prints how long each import and
+# initialization phase took and exits.
+STARTUP_PROFILE = os.getenv("STARTUP_PROFILE", "").lower() in ("1", "true", "yes")
+
+# Updates from different users run concurrently; each user's updates stay in order.
+# A user with UPDATE_QUEUE_DEPTH updates waiting has the rest dropped ("drop") or held back ("defer").
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "64"))
+UPDATE_QUEUE_DEPTH = int(os.getenv("UPDATE_QUEUE_DEPTH", "20"))
+UPDATE_FLOOD_POLICY = os.getenv("UPDATE_FLOOD_POLICY", "drop").lower()
+
+# Outbound flood limits (Telegram allows ~30 msg/s overall, ~1 msg/s per chat and 20 msg/min per group)
+RATE_OVERALL = float(os.getenv("RATE_OVERALL", "30"))
+RATE_PER_CHAT = float(os.getenv("RATE_PER_CHAT", "1"))
+RATE_PER_CHAT_BURST = int(os.getenv("RATE_PER_CHAT_BURST", "3"))
+RATE_GROUP_PER_MINUTE = int(os.getenv("RATE_GROUP_PER_MINUTE", "20"))
+RATE_MAX_RETRIES = int(os.getenv("RATE_MAX_RETRIES", "3"))
+
+# Inbound flood guard: a user sending more than FLOOD_USER_LIMIT messages/button presses within FLOOD_USER_WINDOW
+# seconds is ignored for FLOOD_BAN seconds, doubling on every repeat up to FLOOD_BAN_MAX. FLOOD_GLOBAL_RATE caps
+# the updates let in per second overall (0 disables; per worker in sharded mode). Users idle for FLOOD_IDLE_AFTER
+# seconds are forgotten, strikes included, and at most FLOOD_MAX_USERS are tracked. Admins are exempt.
+FLOOD_USER_LIMIT = int(os.getenv("FLOOD_USER_LIMIT", "20"))
+FLOOD_USER_WINDOW = float(os.getenv("FLOOD_USER_WINDOW", "10"))
+FLOOD_BAN = float(os.getenv("FLOOD_BAN", "60"))
+FLOOD_BAN_MAX = float(os.getenv("FLOOD_BAN_MAX", "3600"))
+FLOOD_GLOBAL_RATE = float(os.getenv("FLOOD_GLOBAL_RATE", "100"))
+FLOOD_IDLE_AFTER = float(os.getenv("FLOOD_IDLE_AFTER", "600"))
+FLOOD_MAX_USERS = int(os.getenv("FLOOD_MAX_USERS", "50000"))
+
+# Bot API connections. Outbound calls get a pool of HTTP_POOL_SIZE connections (by default 256, as
+# Application.builder() would give us), separate from the GET_UPDATES_POOL_SIZE used by long polling.
+# Up to HTTP_KEEPALIVE_CONNECTIONS idle connections are kept open for HTTP_KEEPALIVE_EXPIRY seconds so
+# bursts skip the TCP/TLS handshake. HTTP_VERSION=2 multiplexes calls over fewer connections and needs
+# the python-telegram-bot[http2] extra.
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "256"))
+GET_UPDATES_POOL_SIZE = int(os.getenv("GET_UPDATES_POOL_SIZE", "1"))
+HTTP_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_KEEPALIVE_CONNECTIONS", str(HTTP_POOL_SIZE)))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_VERSION = os.getenv("HTTP_VERSION", "1.1")
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "5"))
+HTTP_WRITE_TIMEOUT = float(os.getenv("HTTP_WRITE_TIMEOUT", "5"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "3"))
+
+# BOT_SHARDS > 1 runs a front process that only receives updates and BOT_SHARDS worker processes that
+# handle them, each user always on the same worker. The subscription and chat caches are then shared
+# between workers; SHARD_QUEUE_SIZE bounds the updates waiting for each worker. Each worker keeps
+# shared cache entries locally for up to SHARED_CACHE_LOCAL_TTL seconds, and gets an equal share
+# of RATE_OVERALL.
+BOT_SHARDS = int(os.getenv("BOT_SHARDS", "1"))
+SHARD_QUEUE_SIZE = int(os.getenv("SHARD_QUEUE_SIZE", "1000"))
+SHARED_CACHE_LOCAL_TTL = float(os.getenv("SHARED_CACHE_LOCAL_TTL", "60"))
+
+# Point the bot at a different Bot API server, e.g. the local stand-in in fake_telegram.py
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL")
+
+# Handler/API latency and cache stats are served at http://METRICS_HOST:METRICS_PORT/metrics (0 disables)
+# and summarised in the log every METRICS_LOG_INTERVAL seconds (0 disables).
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+METRICS_LOG_INTERVAL = float(os.getenv("METRICS_LOG_INTERVAL", "300"))
+# -------------------------------
+startup_timer.mark("config")
+
+# --- Keyboard: built on first use, not at import time ---
+
+@functools.cache
+def main_keyboard() -> ReplyKeyboardMarkup:
+    """The reply keyboard with every user/chat request button"""
+    admin_rights = ChatAdministratorRights(
+        is_anonymous=False, can_manage_chat=True, can_delete_messages=True, can_manage_video_chats=True, 
+        can_restrict_members=True, can_promote_members=True, can_change_info=True, can_invite_users=True, 
+        can_post_messages=True, can_edit_messages=True, can_pin_messages=True, can_post_stories=True, 
+        can_edit_stories=True, can_delete_stories=True, can_manage_topics=True
+    )
+    layout = [
+        [
+            KeyboardButton("👤 User", request_users=KeyboardButtonRequestUsers(request_id=1, user_is_bot=False, request_name=True, request_username=True)),
+            KeyboardButton("⭐ Premium", request_users=KeyboardButtonRequestUsers(request_id=2, user_is_bot=False, user_is_premium=True, request_name=True, request_username=True)),
+            KeyboardButton("🤖 Bot", request_users=KeyboardButtonRequestUsers(request_id=3, user_is_bot=True, request_name=True, request_username=True))
+        ],
+        [
+            KeyboardButton("👥 Group", request_chat=KeyboardButtonRequestChat(request_id=4, chat_is_channel=False, request_title=True, request_username=True)),
+            KeyboardButton("📢 Channel", request_chat=KeyboardButtonRequestChat(request_id=5, chat_is_channel=True, request_title=True, request_username=True)),
+            KeyboardButton("💬 Forum", request_chat=KeyboardButtonRequestChat(request_id=6, chat_is_channel=False, chat_is_forum=True, request_title=True, request_username=True))
+        ],
+        [
+            KeyboardButton("👥 My Group", request_chat=KeyboardButtonRequestChat(request_id=7, chat_is_channel=False, user_administrator_rights=admin_rights, request_title=True, request_username=True)),
+            KeyboardButton("📢 My Channel", request_chat=KeyboardButtonRequestChat(request_id=8, chat_is_channel=True, user_administrator_rights=admin_rights, request_title=True, request_username=True)),
+            KeyboardButton("💬 My Forum", request_chat=KeyboardButtonRequestChat(request_id=9, chat_is_channel=False, chat_is_forum=True, user_administrator_rights=admin_rights, request_title=True, request_username=True))
+        ]
+    ]
+    return ReplyKeyboardMarkup(layout, resize_keyboard=True)
 
-DEFAULT_ADMIN_RIGHTS = ChatAdministratorRights(
-    is_anonymous=False, can_manage_chat=True, can_delete_messages=True, can_manage_video_chats=True, 
-    can_restrict_members=True, can_promote_members=True, can_change_info=True, can_invite_users=True, 
-    can_post_messages=True, can_edit_messages=True, can_pin_messages=True, can_post_stories=True, 
-    can_edit_stories=True, can_delete_stories=True, can_manage_topics=True
-)
+def reply_keyboard(chat_id, force: bool = False) -> Optional[ReplyKeyboardMarkup]:
+    """The main keyboard for a reply in chat_id, or None while the chat already shows it"""
+    return keyboards.markup(chat_id, main_keyboard(), force)
 
-# Define the keyboard layout once (No change needed here, the fix was in the import)
-KEYBOARD_LAYOUT = [
-    [
-        KeyboardButton("👤 User", request_users=KeyboardButtonRequestUsers(request_id=1, user_is_bot=False)),
-        KeyboardButton("⭐ Premium", request_users=KeyboardButtonRequestUsers(request_id=2, user_is_bot=False, user_is_premium=True)),
-        KeyboardButton("🤖 Bot", request_users=KeyboardButtonRequestUsers(request_id=3, user_is_bot=True))
-    ],
-    [
-        KeyboardButton("👥 Group", request_chat=KeyboardButtonRequestChat(request_id=4, chat_is_channel=False)),
-        KeyboardButton("📢 Channel", request_chat=KeyboardButtonRequestChat(request_id=5, chat_is_channel=True)),
-        KeyboardButton("💬 Forum", request_chat=KeyboardButtonRequestChat(request_id=6, chat_is_channel=False, chat_is_forum=True))
-    ],
-    [
-        KeyboardButton("👥 My Group", request_chat=KeyboardButtonRequestChat(request_id=7, chat_is_channel=False, user_administrator_rights=DEFAULT_ADMIN_RIGHTS)),
-        KeyboardButton("📢 My Channel", request_chat=KeyboardButtonRequestChat(request_id=8, chat_is_channel=True, user_administrator_rights=DEFAULT_ADMIN_RIGHTS)),
-        KeyboardButton("💬 My Forum", request_chat=KeyboardButtonRequestChat(request_id=9, chat_is_channel=False, chat_is_forum=True, user_administrator_rights=DEFAULT_ADMIN_RIGHTS))
-    ]
-]
+async def send_with_keyboard(send, chat_id, /, *args, force: bool = False, **kwargs):
+    """Awaits send(*args, **kwargs) with the main keyboard attached if chat_id needs it.
 
-MAIN_KEYBOARD = ReplyKeyboardMarkup(KEYBOARD_LAYOUT, resize_keyboard=True)
+    The chat only counts as showing the keyboard once the send went through.
+    """
+    markup = reply_keyboard(chat_id, force)
+    result = await send(*args, reply_markup=markup, **kwargs)
+    if markup is not None:
+        keyboards.mark_shown(chat_id)
+    return result
 
 # ------------------- FORCE SUB HELPER FUNCTIONS ----------------------
 
-async def check_subscription(user_id, context: ContextTypes.DEFAULT_TYPE) -> bool:
-    """Checks if the user is a member of the required channel."""
+sub_cache = TTLCache(maxsize=SUB_CACHE_SIZE, ttl=SUB_CACHE_TTL)
+membership = MembershipIndex(MEMBERSHIP_INDEX_SIZE, MEMBERSHIP_MAX_AGE)
+inflight = SingleFlight()
+store = Store(STORE_PATH, STORE_FLUSH_INTERVAL)
+
+def is_upstream_failure(error: Exception) -> bool:
+    """Timeouts, connection and server errors; a BadRequest means Telegram is up and answering."""
+    return isinstance(error, (NetworkError, RetryAfter)) and not isinstance(error, BadRequest)
+
+membership_breaker = CircuitBreaker(
+    "get_chat_member", SUB_BREAKER_FAILURES, SUB_BREAKER_COOLDOWN, SUB_BREAKER_PROBES, is_upstream_failure
+)
+
+async def fetch_chat_member(context: ContextTypes.DEFAULT_TYPE, chat_id, user_id):
+    """get_chat_member, shared between concurrent callers asking for the same member.
+
+    Raises CircuitOpenError without calling Telegram while the membership breaker is open.
+    """
+    return await inflight.do(
+        ("get_chat_member", chat_id, user_id),
+        lambda: membership_breaker.call(lambda: context.bot.get_chat_member(chat_id, user_id))
+    )
+
+async def fetch_chat(context: ContextTypes.DEFAULT_TYPE, chat_id):
+    """get_chat, shared between concurrent callers asking for the same chat."""
+    return await inflight.do(
+        ("get_chat", chat_id, None),
+        lambda: context.bot.get_chat(chat_id)
+    )
+
+# ------------------- CHAT INFO CACHE ----------------------
+
+class ChatInfo(NamedTuple):
+    """The handful of chat/user fields we actually render, instead of a whole telegram.Chat."""
+    id: int
+    type: str
+    title: Optional[str] = None
+    username: Optional[str] = None
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+
+    @classmethod
+    def from_chat(cls, chat):
+        return cls(chat.id, chat.type, chat.title, chat.username, chat.first_name, chat.last_name)
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, ChatType.PRIVATE, None, user.username, user.first_name, user.last_name)
+
+# Chat type implied by the keyboard button a chat was shared through. Plain group
+# buttons can return either a group or a supergroup, so those still need get_chat.
+SHARED_CHAT_TYPES = {
+    5: ChatType.CHANNEL, 8: ChatType.CHANNEL,
+    6: ChatType.SUPERGROUP, 9: ChatType.SUPERGROUP,
+}
+
+chat_cache = TTLCache(maxsize=CHAT_CACHE_SIZE, ttl=CHAT_CACHE_TTL)
+# lowercase username -> chat id, so @username lookups can be answered from chat_cache
+chat_usernames = TTLCache(maxsize=CHAT_CACHE_SIZE, ttl=CHAT_CACHE_TTL)
+
+def remember_chat(info: ChatInfo) -> ChatInfo:
+    """Stores chat metadata seen in an update so later lookups skip get_chat."""
+    chat_cache.set(info.id, info)
+    if info.username:
+        chat_usernames.set(info.username.lower(), info.id)
+    store.record_chat(info)
+    return info
+
+# user id -> ids of the chats/users that user most recently looked up, newest first
+recent_chats = TTLCache(maxsize=INLINE_RECENT_USERS, ttl=CHAT_CACHE_TTL)
+
+def remember_recent(user_id, chat_id):
+    """Puts chat_id at the front of the user's recent lookups, offered again in inline mode."""
+    recent = recent_chats.get(user_id, (), count=False)
+    recent_chats.set(user_id, ((chat_id,) + tuple(c for c in recent if c != chat_id))[:INLINE_RECENT_LIMIT])
+
+async def get_chat_info(context: ContextTypes.DEFAULT_TYPE, chat_id) -> ChatInfo:
+    """Returns cached chat metadata, falling back to get_chat."""
+    info = await chat_cache.aget(chat_id)
+    if info is None:
+        info = remember_chat(ChatInfo.from_chat(await fetch_chat(context, chat_id)))
+    return info
+
+async def cached_chat_info(chat_id) -> Optional[ChatInfo]:
+    """Cached metadata for a numeric id or an @username, without any API call."""
+    if isinstance(chat_id, str):
+        chat_id = await chat_usernames.aget(chat_id.lstrip("@").lower())
+        if chat_id is None:
+            return None
+    return await chat_cache.aget(chat_id)
+
+def shared_user_info(shared_user) -> Optional[ChatInfo]:
+    """Builds user metadata from the name/username fields included in users_shared."""
+    if not shared_user.first_name:
+        return None
+    return ChatInfo(
+        shared_user.user_id, ChatType.PRIVATE, None,
+        shared_user.username, shared_user.first_name, shared_user.last_name
+    )
+
+def shared_chat_info(chat_shared) -> Optional[ChatInfo]:
+    """Builds chat metadata from the title/username fields included in chat_shared."""
+    chat_type = SHARED_CHAT_TYPES.get(chat_shared.request_id)
+    if chat_type is None or not chat_shared.title:
+        return None
+    return ChatInfo(chat_shared.chat_id, chat_type, chat_shared.title, chat_shared.username)
+
+def remember_subscription(user_id, is_member: bool):
+    """Caches a membership result, for minutes if positive and seconds if negative."""
+    sub_cache.set(user_id, is_member, ttl=SUB_CACHE_TTL if is_member else SUB_CACHE_NEGATIVE_TTL)
+    store.record_subscription(user_id, is_member)
+
+async def lookup_subscription(user_id, context: ContextTypes.DEFAULT_TYPE, force_refresh: bool) -> tuple:
+    """Answers from the membership index, then the cache, and only then asks Telegram.
+
+    Returns (is_member, source) where source is "index", "cache", "api", "error" or "breaker".
+    """
+    if force_refresh:
+        sub_cache.invalidate(user_id)
+    else:
+        known = membership.get(user_id)
+        if known is not None:
+            return known, "index"
+        cached = await sub_cache.aget(user_id)
+        if cached is not None:
+            return cached, "cache"
+
     try:
-        member = await context.bot.get_chat_member(MAIN_CHANNEL_ID, user_id)
-        if member.status in ["member", "administrator", "creator"]:
-            return True
-        return False
+        member = await fetch_chat_member(context, MAIN_CHANNEL_ID, user_id)
+        is_member = is_member_status(member)
+        remember_subscription(user_id, is_member)
+        if force_refresh and membership.get(user_id) is not None:
+            membership.record_reconcile(user_id, is_member)
+        return is_member, "api"
     except TelegramError as e:
-        logger.error(f"Force Sub Error (Check Subscription): {e}")
-        return True 
+        logger.error("Force Sub Error (Check Subscription): %s", e)
+        sub_cache.set(user_id, True, ttl=SUB_CACHE_ERROR_TTL)
+        return True, "error"
+    except CircuitOpenError:
+        # Telegram is known to be failing; let the user through without waiting on it
+        return True, "breaker"
+
+async def check_subscription(user_id, context: ContextTypes.DEFAULT_TYPE, force_refresh: bool = False) -> bool:
+    """Checks if the user is a member of the required channel."""
+    started = time.perf_counter()
+    is_member, source = await lookup_subscription(user_id, context, force_refresh)
+    metrics.SUBSCRIPTION_WAIT.observe(time.perf_counter() - started, source)
+    return is_member
+
+def is_main_channel(chat) -> bool:
+    if isinstance(MAIN_CHANNEL_ID, int) or MAIN_CHANNEL_ID.lstrip("-").isdigit():
+        return chat.id == int(MAIN_CHANNEL_ID)
+    return (chat.username or "").lower() == MAIN_CHANNEL_ID.lstrip("@").lower()
+
+async def handle_channel_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Track joins and leaves of the force-sub channel (needs the bot to be a channel admin)."""
+    chat_member = update.chat_member
+    if not is_main_channel(chat_member.chat):
+        return
+    
+    user_id = chat_member.new_chat_member.user.id
+    is_member = is_member_status(chat_member.new_chat_member)
+    membership.record_event(user_id, is_member)
+    remember_subscription(user_id, is_member)
+
+async def reconcile_membership(context: ContextTypes.DEFAULT_TYPE):
+    """Re-verify the oldest index entries, in case join/leave events were missed."""
+    for user_id in membership.stale(MEMBERSHIP_RECONCILE_BATCH):
+        try:
+            member = await fetch_chat_member(context, MAIN_CHANNEL_ID, user_id)
+        except CircuitOpenError:
+            # Try again next round instead of dropping entries because of an outage
+            return
+        except TelegramError as e:
+            logger.warning("Could not reconcile membership of %s: %s", user_id, e)
+            membership.discard(user_id)
+            continue
+        membership.record_reconcile(user_id, is_member_status(member))
+
+def user_fields(user) -> dict:
+    """Template fields shared by every user layout."""
+    return dict(
+        first_name=user.first_name,
+        last_name=user.last_name or 'None',
+        username=user.username or 'None',
+    )
+
+def bot_premium_fields(user) -> dict:
+    return dict(
+        is_bot='Yes ✅' if user.is_bot else 'No ❌',
+        is_premium='Yes ⭐' if user.is_premium else 'No',
+    )
+
+def chat_fields(chat) -> dict:
+    """Template fields shared by the shared and forwarded chat layouts."""
+    emoji, type_name = CHAT_TYPE_LABELS.get(str(chat.type), ("💬", "Chat"))
+    return dict(
+        emoji=emoji,
+        type_name=type_name,
+        chat_id=chat.id,
+        title=chat.title,
+        username=chat.username or 'None',
+    )
+
+def own_user_response(user) -> str:
+    return templates.OWN_USER.render(
+        user_id=user.id,
+        language=user.language_code or 'Unknown',
+        **user_fields(user),
+        **bot_premium_fields(user)
+    )
+
+def shared_user_response(chat: ChatInfo, sharer) -> str:
+    return templates.SHARED_USER.render(
+        user_id=chat.id,
+        type=chat.type,
+        sharer_name=sharer.first_name,
+        sharer_id=sharer.id,
+        **user_fields(chat)
+    )
+
+def shared_chat_response(chat, sharer) -> str:
+    return templates.SHARED_CHAT.render(sharer_name=sharer.first_name, sharer_id=sharer.id, **chat_fields(chat))
+
+def shared_users_response(chats: dict, sharer) -> str:
+    """Reply to a users_shared update; chats maps each shared user id to its ChatInfo, or None if unknown."""
+    if len(chats) == 1:
+        [(user_id, chat)] = chats.items()
+        if chat is not None:
+            return shared_user_response(chat, sharer)
+        return templates.SHARED_USER_ID.render(user_id=user_id, sharer_name=sharer.first_name, sharer_id=sharer.id)
+    rows = []
+    for user_id, chat in chats.items():
+        if chat is None:
+            rows.append(templates.SHARED_USERS_ROW.render(user_id=user_id))
+        else:
+            name = " ".join(filter(None, (chat.first_name, chat.last_name)))
+            rows.append(templates.SHARED_USERS_ROW_NAMED.render(
+                user_id=user_id, name=f"{name} (@{chat.username})" if chat.username else name
+            ))
+    return templates.SHARED_USERS.render(
+        user_list=templates.Html("\n".join(rows)), sharer_name=sharer.first_name, sharer_id=sharer.id
+    )
+
+def shared_chats_response(chats: dict, sharer) -> str:
+    """Reply to a chat_shared update; chats maps the shared chat id to its ChatInfo, or None if unknown."""
+    [(chat_id, chat)] = chats.items()
+    if chat is not None:
+        return shared_chat_response(chat, sharer)
+    return templates.SHARED_CHAT_ID.render(chat_id=chat_id, sharer_name=sharer.first_name, sharer_id=sharer.id)
+
+def enrich_response(respond, chats: dict, sharer, lookups: dict) -> Optional[str]:
+    """Background second phase of a shared users/chat reply: the reply again with the looked-up details"""
+    found = {chat_id: chat for chat_id, chat in lookups.items() if isinstance(chat, ChatInfo)}
+    if not found:
+        return None
+    return respond({**chats, **found}, sharer)
+
+# Replies to shared users/chats, edited once their missing details have been looked up
+enrichment = EnrichmentQueue(
+    get_chat_info, ENRICH_CONCURRENCY, ENRICH_BATCH_SIZE, ENRICH_MAX_PENDING,
+    edit_kwargs={"parse_mode": ParseMode.HTML, "rate_limit_args": {"priority": PRIORITY_NOTICE}}
+)
+
+CHAT_TYPE_LABELS = {
+    ChatType.CHANNEL.value: ("📢", "Channel"),
+    ChatType.SUPERGROUP.value: ("👥", "Supergroup"),
+    ChatType.GROUP.value: ("👥", "Group"),
+}
+
+# Whether each chat shows the main keyboard: replies skip re-sending it, repeat force-sub notices skip removing it
+keyboards = KeyboardTracker(maxsize=SUB_CACHE_SIZE, resend_after=KEYBOARD_RESEND_AFTER)
+force_sub_file_id = None
+
+def save_force_sub_file_id(file_id):
+    """Remembers (or with None, forgets) the file_id of the force-sub photo."""
+    global force_sub_file_id
+    force_sub_file_id = file_id
+    store.set_value("force_sub_file_id", file_id)
+
+async def send_force_sub_photo(context: ContextTypes.DEFAULT_TYPE, message_object, keyboard):
+    """Sends the force-sub photo, preferring the cached file_id over the URL and the local file."""
+    sources = [force_sub_file_id, FORCE_SUB_IMAGE_URL]
+    if FORCE_SUB_IMAGE_PATH and os.path.exists(FORCE_SUB_IMAGE_PATH):
+        sources.append(FORCE_SUB_IMAGE_PATH)
+    
+    error = None
+    for photo in sources:
+        if not photo:
+            continue
+        try:
+            if photo == FORCE_SUB_IMAGE_PATH:
+                with open(FORCE_SUB_IMAGE_PATH, "rb") as f:
+                    photo = f.read()
+            # Notices yield to interactive replies when the outbound rate limit is saturated
+            sent = await context.bot.send_photo(
+                chat_id=message_object.chat_id,
+                photo=photo,
+                caption=FORCE_SUB_TEXT,
+                reply_markup=keyboard,
+                parse_mode=ParseMode.HTML,
+                reply_to_message_id=message_object.message_id,
+                rate_limit_args={"priority": PRIORITY_NOTICE}
+            )
+        except BadRequest as e:
+            # Telegram rejected the file_id or could not fetch the URL; try the next source
+            logger.warning("Force sub photo source failed (%s), trying next", e)
+            if photo == force_sub_file_id:
+                save_force_sub_file_id(None)
+            error = e
+            continue
+        
+        if sent.photo and sent.photo[-1].file_id != force_sub_file_id:
+            save_force_sub_file_id(sent.photo[-1].file_id)
+        return sent
+    raise error
 
 async def send_force_sub_message(update: Update, context: ContextTypes.DEFAULT_TYPE, message_object):
     """Sends the force subscribe message with image and inline keyboard."""
@@ -86,39 +597,167 @@ async def send_force_sub_message(update: Update, context: ContextTypes.DEFAULT_T
         [InlineKeyboardButton("🔄 Try Again", callback_data='check_sub')]
     ])
     
-    message_text = f"""
-<b>🛑 Access Denied!</b>
-
-You must join our Update Channel {MAIN_CHANNEL_ID} to use this bot.
-Please click the button below and then click **Try Again**.
-
-<b>Developer:</b> {DEVELOPER}
-"""
-    
     try:
-        await message_object.reply_photo(
-            photo=FORCE_SUB_IMAGE_URL,
-            caption=message_text,
-            reply_markup=keyboard,
-            parse_mode=ParseMode.HTML,
-            reply_to_message_id=message_object.message_id
-        )
+        await send_force_sub_photo(context, message_object, keyboard)
         
-        await context.bot.send_message(
-            chat_id=message_object.chat_id,
-            text="Tap a command or button when ready:",
-            reply_markup=ReplyKeyboardRemove(),
-            resize_keyboard=True
-        )
+        # A message can carry either the inline keyboard or ReplyKeyboardRemove, so removal
+        # needs its own message; it is only sent while the chat may still show the main keyboard
+        if keyboards.needs_removal(message_object.chat_id):
+            await context.bot.send_message(
+                chat_id=message_object.chat_id,
+                text="Tap a command or button when ready:",
+                reply_markup=ReplyKeyboardRemove(),
+                rate_limit_args={"priority": PRIORITY_NOTICE}
+            )
+            keyboards.mark_removed(message_object.chat_id)
         
     except Exception as e:
-        logger.error(f"Error sending force sub message: {e}")
+        logger.error("Error sending force sub message: %s", e)
         await message_object.reply_text(
             f"Please join {MAIN_CHANNEL_ID} and try again."
         )
 
+# ------------------- BULK LOOKUPS ----------------------
+
+# @username, t.me/<username> (optionally /s/ or a trailing message id), t.me/c/<internal id>, or a numeric id
+REFERENCE_PATTERN = re.compile(
+    r"(?:https?://)?(?:t|telegram)\.me/(?:s/)?(?:c/(?P<internal>\d+)|(?P<link>[A-Za-z]\w{3,31}))"
+    r"|(?<![\w.@])@(?P<username>[A-Za-z]\w{3,31})"
+    r"|(?<![\w/])(?P<id>-?\d{5,15})\b"
+)
+# t.me paths that are not usernames
+RESERVED_LINK_PATHS = {"joinchat", "addstickers", "addemoji", "addlist", "addtheme", "share", "proxy", "socks", "login", "boost", "setlanguage", "invoice", "confirmphone"}
+
+def parse_references(text: str) -> list:
+    """Usernames ("@name") and ids in text, in order of first appearance and without duplicates."""
+    references = {}
+    for match in REFERENCE_PATTERN.finditer(text):
+        if match["internal"]:
+            reference = int(f"-100{match['internal']}")
+        elif match["id"]:
+            reference = int(match["id"])
+        else:
+            name = match["link"] or match["username"]
+            if name.lower() in RESERVED_LINK_PATHS:
+                continue
+            reference = f"@{name}"
+        key = reference.lower() if isinstance(reference, str) else reference
+        references.setdefault(key, reference)
+    return list(references.values())
+
+async def resolve_reference(context: ContextTypes.DEFAULT_TYPE, reference):
+    """ChatInfo for a reference, or an error description."""
+    info = await cached_chat_info(reference)
+    if info is not None:
+        return info
+    try:
+        # Normalised so concurrent lookups of the same username share one get_chat
+        chat_id = reference.lower() if isinstance(reference, str) else reference
+        return remember_chat(ChatInfo.from_chat(await fetch_chat(context, chat_id)))
+    except BadRequest:
+        return "not found"
+    except TelegramError as e:
+        return str(e)
+
+def bulk_row(reference, result) -> str:
+    reference = str(reference)
+    if result is None:
+        return templates.BULK_ROW_PENDING.render(reference=reference)
+    if isinstance(result, str):
+        return templates.BULK_ROW_FAILED.render(reference=reference, error=result)
+    if result.type == ChatType.PRIVATE:
+        emoji, type_name = "👤", "User"
+        title = " ".join(filter(None, (result.first_name, result.last_name)))
+    else:
+        emoji, type_name = CHAT_TYPE_LABELS.get(str(result.type), ("💬", "Chat"))
+        title = result.title
+    return templates.BULK_ROW.render(reference=reference, chat_id=result.id, emoji=emoji, type_name=type_name, title=title or "-")
+
+async def bulk_resolve(message, context: ContextTypes.DEFAULT_TYPE, references: list):
+    """Resolves many references concurrently and streams the results into paginated messages."""
+    total = len(references)
+    references = references[:BULK_RESOLVE_LIMIT]
+    results = {reference: await cached_chat_info(reference) for reference in references}
+    pages = [references[i:i + BULK_PAGE_SIZE] for i in range(0, len(references), BULK_PAGE_SIZE)]
+    
+    def render_page(number: int) -> str:
+        text = templates.BULK_PAGE.render(
+            done=sum(result is not None for result in results.values()), total=len(references),
+            page=number + 1, pages=len(pages),
+            rows=templates.Html("\n".join([bulk_row(reference, results[reference]) for reference in pages[number]]))
+        )
+        if total > len(references) and number == len(pages) - 1:
+            text += templates.BULK_TRUNCATED.render(limit=len(references), total=total)
+        return text
+    
+    # One message per page; later flushes only edit pages whose text changed
+    shown = [render_page(number) for number in range(len(pages))]
+    sent = [await message.reply_html(text) for text in shown]
+    
+    semaphore = asyncio.Semaphore(BULK_RESOLVE_CONCURRENCY)
+    async def resolve(reference):
+        async with semaphore:
+            results[reference] = await resolve_reference(context, reference)
+    
+    async def flush() -> bool:
+        """Edits every page whose text changed; False if any edit failed (the page is retried next time)."""
+        flushed = True
+        for number, page_message in enumerate(sent):
+            text = render_page(number)
+            if text != shown[number]:
+                try:
+                    await page_message.edit_text(text, parse_mode=ParseMode.HTML)
+                except TelegramError as e:
+                    logger.warning("Could not update bulk lookup page %s: %s", number + 1, e)
+                    flushed = False
+                    continue
+                shown[number] = text
+        return flushed
+    
+    tasks = {asyncio.create_task(resolve(reference)): reference for reference, result in results.items() if result is None}
+    pending = set(tasks)
+    try:
+        while pending:
+            # Edits are batched: at most one round per BULK_EDIT_INTERVAL, however fast lookups finish
+            done, pending = await asyncio.wait(pending, timeout=BULK_EDIT_INTERVAL)
+            for task in done:
+                # resolve_reference turns Telegram errors into results; anything else ends up here
+                if task.exception() is not None:
+                    logger.error("Bulk lookup of %s failed: %s", tasks[task], task.exception())
+                    results[tasks[task]] = "lookup failed"
+            flushed = await flush()
+    finally:
+        for task in pending:
+            task.cancel()
+    if tasks and not flushed:
+        # One more try so a failed last round does not leave rows at ⏳
+        await asyncio.sleep(BULK_EDIT_INTERVAL)
+        await flush()
+
+group_policy = GroupPolicy(GROUP_REPLY_COOLDOWN, GROUP_DEDUP_WINDOW)
+
+def is_group_message(message) -> bool:
+    return message.chat.type != ChatType.PRIVATE
+
+def needs_subscription_check(message) -> bool:
+    return GROUP_FORCE_SUB or not is_group_message(message)
+
+def is_admin(user) -> bool:
+    return user is not None and user.id in ADMIN_IDS
+
 # ------------------- HANDLERS WITH SUB CHECK -------------------------
 
+def counted(callback):
+    """Counts every run of a handler in the persistent usage counters."""
+    name = callback.__name__
+    
+    @functools.wraps(callback)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        store.increment(name)
+        return await callback(update, context)
+    return wrapper
+
+@counted
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send welcome message when /start is issued"""
     user = update.effective_user
@@ -127,128 +766,72 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await send_force_sub_message(update, context, update.message)
         return
         
-    user_id = user.id
-    welcome_message = f"""
-<b>Hi Welcome To @{context.bot.username} 👋</b>
-
-Using this bot, you can get the numerical ID of users.
-
-<b>Developer:</b> {DEVELOPER}
-
-📚 <b>Help:</b> /help
-
-🔔 <b>Update Channel:</b> <a href="{UPDATE_CHANNEL}">Click Here</a>
-👥 <b>Support Group:</b> <a href="{SUPPORT_GROUP}">Click Here</a>
-
-<b>Your ID:</b> <code>{user_id}</code>
-
-<i>You can check any <b>User | Chat | IDBot</b> just forward or share any chat with me!</i>
-"""
+    welcome_message = templates.WELCOME.render(bot_username=context.bot.username, user_id=user.id)
     
     try:
-        await update.message.reply_html(
+        await send_with_keyboard(
+            update.message.reply_html,
+            update.message.chat_id,
             welcome_message,
-            reply_markup=MAIN_KEYBOARD, 
+            force=True,
             disable_web_page_preview=True,
             reply_to_message_id=update.message.message_id
         )
     except Exception as e:
-        logger.error(f"Error in start command: {e}")
+        logger.error("Error in start command: %s", e)
 
+@counted
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send help message"""
     user = update.effective_user
     if not await check_subscription(user.id, context):
         await send_force_sub_message(update, context, update.message)
         return
-        
-    help_text = f"""
-<b>🔍 How to use this bot:</b>
-
-<b>1️⃣ Get User ID:</b>
-• Click "👤 User" button and select any user
-• Click "⭐ Premium" button to select premium users
-• Click "🤖 Bot" button to select bots
-
-<b>2️⃣ Get Chat ID:</b>
-• Click "👥 Group" button and select any group
-• Click "📢 Channel" button and select any channel
-• Click "💬 Forum" button and select any forum
-
-<b>3️⃣ Get Your Chats:</b>
-• Click "👥 My Group" for groups where you're admin
-• Click "📢 My Channel" for channels where you're admin
-• Click "💬 My Forum" for forums where you're admin
-
-<b>4️⃣ Commands:</b>
-/start - Start bot & show main menu
-/help - Show this help
-/id - Get your ID
-
-<b>💡 Tips:</b>
-✅ Use the keyboard buttons to select chats
-✅ You can also forward messages to get IDs
-✅ Share contacts to get user IDs
-
-<b>Developer:</b> {DEVELOPER}
-<b>Update Channel:</b> {UPDATE_CHANNEL}
-<b>Support Group:</b> {SUPPORT_GROUP}
-"""
     
     try:
-        await update.message.reply_html(
-            help_text,
-            reply_markup=MAIN_KEYBOARD,
+        await send_with_keyboard(
+            update.message.reply_html,
+            update.message.chat_id,
+            templates.HELP,
+            force=True,
             disable_web_page_preview=True
         )
     except Exception as e:
-        logger.error(f"Error in help command: {e}")
+        logger.error("Error in help command: %s", e)
 
+@counted
 async def get_id_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Get ID of user or replied message"""
     message = update.message
     user = update.effective_user
+    target_user = message.reply_to_message.from_user if message.reply_to_message else None
+    in_group = is_group_message(message)
     
-    if not await check_subscription(user.id, context):
+    if in_group and not group_policy.allow(message.chat_id, ("user", (target_user or user).id)):
+        return
+    
+    if needs_subscription_check(message) and not await check_subscription(user.id, context):
         await send_force_sub_message(update, context, update.message)
         return
     
-    if message.reply_to_message:
-        target_user = message.reply_to_message.from_user
-        response = f"""
-<b>👤 User Information:</b>
-
-<b>User ID:</b> <code>{target_user.id}</code>
-<b>First Name:</b> {target_user.first_name}
-<b>Last Name:</b> {target_user.last_name or 'None'}
-<b>Username:</b> @{target_user.username if target_user.username else 'None'}
-<b>Is Bot:</b> {'Yes ✅' if target_user.is_bot else 'No ❌'}
-<b>Is Premium:</b> {'Yes ⭐' if target_user.is_premium else 'No'}
-
-<i>Reply sent by:</i> {user.first_name} (<code>{user.id}</code>)
-"""
+    if target_user:
+        response = templates.REPLIED_USER.render(
+            user_id=target_user.id,
+            sharer_name=user.first_name,
+            sharer_id=user.id,
+            **user_fields(target_user),
+            **bot_premium_fields(target_user)
+        )
     else:
-        response = f"""
-<b>👤 Your Information:</b>
-
-<b>Your ID:</b> <code>{user.id}</code>
-<b>First Name:</b> {user.first_name}
-<b>Last Name:</b> {user.last_name or 'None'}
-<b>Username:</b> @{user.username if user.username else 'None'}
-<b>Is Bot:</b> {'Yes ✅' if user.is_bot else 'No ❌'}
-<b>Is Premium:</b> {'Yes ⭐' if user.is_premium else 'No'}
-<b>Language:</b> {user.language_code or 'Unknown'}
-
-<i>💡 Tip: Use the keyboard buttons to select users and chats!</i>
-
-<b>Developer:</b> {DEVELOPER}
-"""
+        response = own_user_response(user)
     
     try:
-        await message.reply_html(response, reply_markup=MAIN_KEYBOARD)
+        # The user/chat picker buttons only work in private chats
+        await (message.reply_html(response) if in_group else send_with_keyboard(message.reply_html, message.chat_id, response))
     except Exception as e:
-        logger.error(f"Error in get_id command: {e}")
+        logger.error("Error in get_id command: %s", e)
 
+@counted
 async def handle_user_shared(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle when user shares users (from keyboard buttons)"""
     message = update.message
@@ -262,55 +845,30 @@ async def handle_user_shared(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
     
     shared_users = message.users_shared.users
+    chats = {}
+    for shared_user in shared_users:
+        chat = shared_user_info(shared_user)
+        if chat is not None:
+            remember_chat(chat)
+        else:
+            chat = await cached_chat_info(shared_user.user_id)
+        chats[shared_user.user_id] = chat
+        remember_recent(user.id, shared_user.user_id)
     
-    if len(shared_users) == 1:
-        shared_user = shared_users[0]
-        user_id = shared_user.user_id  
-        
-        try:
-            chat = await context.bot.get_chat(user_id)
-            
-            response = f"""
-<b>👤 User Information:</b>
-
-<b>User ID:</b> <code>{chat.id}</code>
-<b>First Name:</b> {chat.first_name}
-<b>Last Name:</b> {chat.last_name or 'None'}
-<b>Username:</b> @{chat.username if chat.username else 'None'}
-<b>Type:</b> {chat.type}
-
-<i>Shared by: {user.first_name} (<code>{user.id}</code>)</i>
-
-<b>Developer:</b> {DEVELOPER}
-"""
-        except Exception as e:
-            logger.warning(f"Could not get_chat for user {user_id}: {e}")
-            response = f"""
-<b>👤 User Information:</b>
-
-<b>User ID:</b> <code>{user_id}</code>
-
-<i>Shared by: {user.first_name} (<code>{user.id}</code>)</i>
-
-<b>Developer:</b> {DEVELOPER}
-"""
-    else:
-        user_list = "\n".join([f"• <code>{u.user_id}</code>" for u in shared_users])
-        response = f"""
-<b>👥 Multiple Users Shared:</b>
-
-{user_list}
-
-<i>Shared by: {user.first_name} (<code>{user.id}</code>)</i>
-
-<b>Developer:</b> {DEVELOPER}
-"""
-    
+    # Telegram refuses edits of messages carrying a reply keyboard, so a reply that is still
+    # to be filled in goes out without one (and leaves the keyboard state alone)
+    missing = tuple(user_id for user_id, chat in chats.items() if chat is None)
     try:
-        await message.reply_html(response, reply_markup=MAIN_KEYBOARD)
+        response = shared_users_response(chats, user)
+        reply = await (message.reply_html(response) if missing else send_with_keyboard(message.reply_html, message.chat_id, response))
     except Exception as e:
-        logger.error(f"Error handling user shared: {e}")
+        logger.error("Error handling user shared: %s", e)
+        return
+    
+    if missing:
+        enrichment.submit(context.job_queue, EnrichmentJob(reply, missing, functools.partial(enrich_response, shared_users_response, chats, user)))
 
+@counted
 async def handle_chat_shared(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle when user shares a chat (from keyboard buttons)"""
     message = update.message
@@ -326,52 +884,26 @@ async def handle_chat_shared(update: Update, context: ContextTypes.DEFAULT_TYPE)
     chat_shared = message.chat_shared
     chat_id = chat_shared.chat_id 
     
-    try:
-        shared_chat = await context.bot.get_chat(chat_id)
-        
-        chat_type = shared_chat.type
-        if chat_type == ChatType.CHANNEL:
-            emoji = "📢"
-            type_name = "Channel"
-        elif chat_type == ChatType.SUPERGROUP:
-            emoji = "👥"
-            type_name = "Supergroup"
-        elif chat_type == ChatType.GROUP:
-            emoji = "👥"
-            type_name = "Group"
-        else:
-            emoji = "💬"
-            type_name = "Chat"
-        
-        response = f"""
-<b>{emoji} {type_name} Information:</b>
-
-<b>Chat ID:</b> <code>{shared_chat.id}</code>
-<b>Title:</b> {shared_chat.title}
-<b>Username:</b> @{shared_chat.username if shared_chat.username else 'None'}
-<b>Type:</b> {type_name}
-
-<i>Shared by: {user.first_name} (<code>{user.id}</code>)</i>
-
-<b>Developer:</b> {DEVELOPER}
-"""
-    except Exception as e:
-        logger.warning(f"Could not get_chat for chat {chat_id}: {e}")
-        response = f"""
-<b>💬 Chat Information:</b>
-
-<b>Chat ID:</b> <code>{chat_id}</code>
-
-<i>Shared by: {user.first_name} (<code>{user.id}</code>)</i>
-
-<b>Developer:</b> {DEVELOPER}
-"""
+    shared_chat = shared_chat_info(chat_shared)
+    if shared_chat is not None:
+        remember_chat(shared_chat)
+    else:
+        shared_chat = await cached_chat_info(chat_id)
+    remember_recent(user.id, chat_id)
+    chats = {chat_id: shared_chat}
     
     try:
-        await message.reply_html(response, reply_markup=MAIN_KEYBOARD)
+        # No keyboard on a reply that is still to be edited (see handle_user_shared)
+        response = shared_chats_response(chats, user)
+        reply = await (message.reply_html(response) if shared_chat is None else send_with_keyboard(message.reply_html, message.chat_id, response))
     except Exception as e:
-        logger.error(f"Error handling chat shared: {e}")
+        logger.error("Error handling chat shared: %s", e)
+        return
+    
+    if shared_chat is None:
+        enrichment.submit(context.job_queue, EnrichmentJob(reply, (chat_id,), functools.partial(enrich_response, shared_chats_response, chats, user)))
 
+@counted
 async def handle_forwarded_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle forwarded messages"""
     
@@ -382,73 +914,35 @@ async def handle_forwarded_message(update: Update, context: ContextTypes.DEFAULT
         await send_force_sub_message(update, context, update.message)
         return
     
+    # PTB 21 only exposes forward_origin (user, hidden user, chat or channel)
+    origin = message.forward_origin
     try:
-        if message.forward_from:
-            forward_user = message.forward_from
-            response = f"""
-<b>✉️ Forwarded Message Info (User):</b>
-
-<b>Sender ID:</b> <code>{forward_user.id}</code>
-<b>First Name:</b> {forward_user.first_name}
-<b>Last Name:</b> {forward_user.last_name or 'None'}
-<b>Username:</b> @{forward_user.username if forward_user.username else 'None'}
-<b>Is Bot:</b> {'Yes ✅' if forward_user.is_bot else 'No ❌'}
-<b>Is Premium:</b> {'Yes ⭐' if forward_user.is_premium else 'No'}
-
-<i>Forwarded by: {user.first_name}</i>
-
-<b>Developer:</b> {DEVELOPER}
-"""
-            await message.reply_html(response, reply_markup=MAIN_KEYBOARD)
-            
-        elif message.forward_from_chat:
-            chat = message.forward_from_chat
-            chat_type = chat.type
-            
-            if chat_type == "channel":
-                emoji = "📢"
-                type_name = "Channel"
-            elif chat_type == "supergroup":
-                emoji = "👥"
-                type_name = "Supergroup"
-            elif chat_type == "group":
-                emoji = "👥"
-                type_name = "Group"
-            else:
-                emoji = "💬"
-                type_name = "Chat"
+        if origin.type == MessageOriginType.USER:
+            forward_user = origin.sender_user
+            remember_chat(ChatInfo.from_user(forward_user))
+            remember_recent(user.id, forward_user.id)
+            response = templates.FORWARDED_USER.render(
+                user_id=forward_user.id,
+                sharer_name=user.first_name,
+                **user_fields(forward_user),
+                **bot_premium_fields(forward_user)
+            )
+            await send_with_keyboard(message.reply_html, message.chat_id, response)
             
-            response = f"""
-<b>{emoji} {type_name} Information (Forwarded):</b>
-
-<b>Chat ID:</b> <code>{chat.id}</code>
-<b>Title:</b> {chat.title}
-<b>Username:</b> @{chat.username if chat.username else 'None'}
-<b>Type:</b> {type_name}
-
-<i>Forwarded by: {user.first_name}</i>
-
-<b>Developer:</b> {DEVELOPER}
-"""
-            await message.reply_html(response, reply_markup=MAIN_KEYBOARD)
+        elif origin.type in (MessageOriginType.CHAT, MessageOriginType.CHANNEL):
+            chat = origin.sender_chat if origin.type == MessageOriginType.CHAT else origin.chat
+            remember_chat(ChatInfo.from_chat(chat))
+            remember_recent(user.id, chat.id)
+            response = templates.FORWARDED_CHAT.render(sharer_name=user.first_name, **chat_fields(chat))
+            await send_with_keyboard(message.reply_html, message.chat_id, response)
         
-        elif message.forward_sender_name:
-            response = f"""
-<b>🔒 Privacy Protected User</b>
-
-<b>Name:</b> {message.forward_sender_name}
-<b>User ID:</b> <i>Hidden (User has privacy settings enabled)</i>
-
-<i>This user has enabled forward privacy settings, so their ID cannot be retrieved.</i>
-
-<i>Forwarded by: {user.first_name}</i>
-
-<b>Developer:</b> {DEVELOPER}
-"""
-            await message.reply_html(response, reply_markup=MAIN_KEYBOARD)
+        elif origin.type == MessageOriginType.HIDDEN_USER:
+            response = templates.FORWARDED_HIDDEN.render(name=origin.sender_user_name, sharer_name=user.first_name)
+            await send_with_keyboard(message.reply_html, message.chat_id, response)
     except Exception as e:
-        logger.error(f"Error handling forwarded message: {e}")
+        logger.error("Error handling forwarded message: %s", e)
 
+@counted
 async def handle_shared_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle shared contacts"""
     
@@ -461,67 +955,78 @@ async def handle_shared_contact(update: Update, context: ContextTypes.DEFAULT_TY
     
     contact = message.contact
     
-    response = f"""
-<b>📇 Contact Information:</b>
-
-<b>User ID:</b> <code>{contact.user_id if contact.user_id else 'Not available'}</code>
-<b>First Name:</b> {contact.first_name}
-<b>Last Name:</b> {contact.last_name or 'None'}
-<b>Phone:</b> {contact.phone_number}
-
-<i>Shared by: {user.first_name} (<code>{user.id}</code>)</i>
-
-<b>Developer:</b> {DEVELOPER}
-"""
+    response = templates.CONTACT.render(
+        user_id=contact.user_id if contact.user_id else 'Not available',
+        first_name=contact.first_name,
+        last_name=contact.last_name or 'None',
+        phone=contact.phone_number,
+        sharer_name=user.first_name,
+        sharer_id=user.id
+    )
     
     try:
-        await message.reply_html(response, reply_markup=MAIN_KEYBOARD)
+        await send_with_keyboard(message.reply_html, message.chat_id, response)
     except Exception as e:
-        logger.error(f"Error handling shared contact: {e}")
+        logger.error("Error handling shared contact: %s", e)
 
+@counted
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle other text messages"""
     message = update.message
     user = update.effective_user
     
-    if not await check_subscription(user.id, context):
+    if is_group_message(message):
+        # Every group line still refreshes the chat metadata, but few get an answer
+        remember_chat(ChatInfo.from_chat(message.chat))
+        remember_recent(user.id, message.chat_id)
+        if not group_policy.allow(message.chat_id, ("user", user.id), is_addressed_to(message, context.bot)):
+            return
+    
+    if needs_subscription_check(message) and not await check_subscription(user.id, context):
         await send_force_sub_message(update, context, update.message)
         return
     
-    if message.chat.type == "private":
-        response = f"""
-<b>👋 Hi {user.first_name}!</b>
-
-<b>Your ID:</b> <code>{user.id}</code>
-
-<i>💡 Use the keyboard buttons below to select users or chats!</i>
-
-Use /start to see the welcome message.
-
-<b>Developer:</b> {DEVELOPER}
-"""
+    if not is_group_message(message):
+        references = parse_references(message.text) if is_admin(user) else None
+        if references:
+            try:
+                await bulk_resolve(message, context, references)
+            except Exception as e:
+                logger.error("Error in bulk lookup: %s", e)
+            return
+        
+        response = templates.PRIVATE_GREETING.render(first_name=user.first_name, user_id=user.id)
         
         try:
-            await message.reply_html(response, reply_markup=MAIN_KEYBOARD)
+            await send_with_keyboard(message.reply_html, message.chat_id, response)
         except Exception as e:
-            logger.error(f"Error handling text message: {e}")
+            logger.error("Error handling text message: %s", e)
     else:
         chat = message.chat
-        response = f"""
-<b>📊 Chat Information:</b>
-
-<b>Chat ID:</b> <code>{chat.id}</code>
-<b>Chat Title:</b> {chat.title}
-<b>Chat Type:</b> {chat.type}
-<b>Your ID:</b> <code>{user.id}</code>
-
-<b>Developer:</b> {DEVELOPER}
-"""
+        response = templates.GROUP_CHAT.render(chat_id=chat.id, title=chat.title, type=chat.type, user_id=user.id)
         try:
             await message.reply_html(response)
         except Exception as e:
-            logger.error(f"Error handling group message: {e}")
+            logger.error("Error handling group message: %s", e)
+
+@counted
+async def resolve_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/resolve @name t.me/name ... - bulk ID lookup for admins"""
+    message = update.message
+    if not is_admin(update.effective_user):
+        await message.reply_text("This command is only available to the bot admins.")
+        return
+    
+    references = parse_references(" ".join(context.args))
+    if not references:
+        await message.reply_html("Send <code>/resolve</code> followed by @usernames, t.me links or IDs.")
+        return
+    try:
+        await bulk_resolve(message, context, references)
+    except Exception as e:
+        logger.error("Error in resolve command: %s", e)
 
+@counted
 async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle callback queries from the 'Try Again' button."""
     query = update.callback_query
@@ -530,77 +1035,431 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
     await query.answer()
     
     if query.data == 'check_sub':
-        if await check_subscription(user.id, context):
+        if await check_subscription(user.id, context, force_refresh=True):
             try:
                 await query.edit_message_caption(
-                    caption="✅ **Subscription Confirmed!** You now have full access. Select an option below.",
+                    caption=templates.SUB_CONFIRMED_CAPTION,
                     parse_mode=ParseMode.HTML
                 )
                 
-                await context.bot.send_message(
+                await send_with_keyboard(
+                    context.bot.send_message,
+                    query.message.chat_id,
                     chat_id=query.message.chat_id,
                     text="Welcome back! Select an option below.",
-                    reply_markup=MAIN_KEYBOARD
+                    force=True
                 )
                 
             except Exception:
-                 await context.bot.send_message(
+                 await send_with_keyboard(
+                    context.bot.send_message,
+                    query.message.chat_id,
                     chat_id=query.message.chat_id,
                     text="✅ Subscription Confirmed! Select an option below.",
-                    reply_markup=MAIN_KEYBOARD
+                    force=True
                 )
         else:
             await query.edit_message_caption(
-                caption="❌ **Subscription Failed.** Please ensure you have joined the channel and try again.",
+                caption=templates.SUB_FAILED_CAPTION,
                 parse_mode=ParseMode.HTML,
                 reply_markup=query.message.reply_markup
             )
 
+def inline_article(result_id: str, title: str, description: str, text: str) -> InlineQueryResultArticle:
+    return InlineQueryResultArticle(
+        id=result_id,
+        title=title,
+        description=description,
+        input_message_content=InputTextMessageContent(
+            text, parse_mode=ParseMode.HTML, link_preview_options=LinkPreviewOptions(is_disabled=True)
+        )
+    )
+
+def matches_query(chat: ChatInfo, query: str) -> bool:
+    if not query:
+        return True
+    haystack = " ".join(str(field) for field in (chat.id, chat.title, chat.username, chat.first_name, chat.last_name) if field)
+    return query.lower().lstrip("@") in haystack.lower()
+
+@counted
+async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Answer @bot queries with the caller's ID and their recently looked-up chats, from memory only"""
+    inline_query = update.inline_query
+    user = inline_query.from_user
+    
+    if not await check_subscription(user.id, context):
+        await inline_query.answer(
+            [], cache_time=0, is_personal=True,
+            button=InlineQueryResultsButton(text=f"Join {MAIN_CHANNEL_ID} to use inline mode", start_parameter="subscribe")
+        )
+        return
+    
+    query = inline_query.query.strip()
+    results = []
+    if matches_query(ChatInfo.from_user(user), query):
+        results.append(inline_article(f"me:{user.id}", "👤 Your ID", str(user.id), own_user_response(user)))
+    
+    for chat_id in recent_chats.get(user.id, ()):
+        chat = await chat_cache.aget(chat_id, count=False)
+        if chat is None or not matches_query(chat, query):
+            continue
+        if chat.type == ChatType.PRIVATE:
+            name = " ".join(filter(None, (chat.first_name, chat.last_name)))
+            results.append(inline_article(f"user:{chat.id}", f"👤 {name}", str(chat.id), shared_user_response(chat, user)))
+        else:
+            emoji, type_name = CHAT_TYPE_LABELS.get(str(chat.type), ("💬", "Chat"))
+            results.append(inline_article(
+                f"chat:{chat.id}", f"{emoji} {chat.title or type_name}", str(chat.id), shared_chat_response(chat, user)
+            ))
+    
+    try:
+        # Results differ per user, so Telegram must not share its cached answer between users
+        await inline_query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=True)
+    except Exception as e:
+        logger.error("Error answering inline query: %s", e)
+
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     """Log errors"""
-    logger.error(f'Update {update} caused error {context.error}', exc_info=context.error)
+    update_id = update.update_id if isinstance(update, Update) else None
+    logger.error(
+        "Update %s caused error %s", Truncated(update, LOG_UPDATE_MAX_CHARS), context.error,
+        exc_info=context.error, extra={"update_id": update_id}
+    )
+
+async def on_startup(application: Application):
+    """Open the store and warm the in-memory caches from it"""
+    global force_sub_file_id
+    # Since build_application: mostly the getMe call in Application.initialize
+    startup_timer.mark("initialize")
+    await store.open()
+    
+    if warm_caches:
+        now = time.time()
+        rows = await store.load_subscriptions(SUB_CACHE_TTL, SUB_CACHE_SIZE)
+        for user_id, is_member, checked_at in reversed(rows):
+            ttl = (SUB_CACHE_TTL if is_member else SUB_CACHE_NEGATIVE_TTL) - (now - checked_at)
+            if ttl > 0:
+                sub_cache.set(user_id, bool(is_member), ttl=ttl)
+        
+        chats = await store.load_chats(CHAT_CACHE_TTL, CHAT_CACHE_SIZE)
+        for chat_id, chat_type, title, username, first_name, last_name, seen_at in reversed(chats):
+            chat_cache.set(chat_id, ChatInfo(chat_id, chat_type, title, username, first_name, last_name), ttl=CHAT_CACHE_TTL - (now - seen_at))
+            if username:
+                chat_usernames.set(username.lower(), chat_id, ttl=CHAT_CACHE_TTL - (now - seen_at))
+        logger.info("💾 Warmed caches from %s: %s subscriptions, %s chats", STORE_PATH, len(sub_cache), len(chat_cache))
+    
+    force_sub_file_id = await store.get_value("force_sub_file_id")
+    
+    global metrics_server
+    if METRICS_PORT:
+        metrics_server = await metrics.start_metrics_server(METRICS_HOST, METRICS_PORT)
+        logger.info("📈 Serving metrics on http://%s:%s/metrics", METRICS_HOST, METRICS_PORT)
+    startup_timer.mark("post_init")
+
+async def on_shutdown(application: Application):
+    """Stop background work, flush buffered writes and close the store"""
+    # Jobs still running would otherwise call the Bot API after it has been shut down
+    enrichment.stop()
+    if metrics_server:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+    await store.close()
+
+async def log_metrics_summary(context: ContextTypes.DEFAULT_TYPE):
+    """Periodic digest of handler and Bot API latencies"""
+    summary = metrics.summary()
+    if summary:
+        logger.info("📈 Metrics summary:\n%s", summary)
+
+async def log_startup_time(context: ContextTypes.DEFAULT_TYPE):
+    """Runs once the application has started receiving updates"""
+    startup_timer.mark("start")
+    logger.info("🚀 Started in %s", startup_timer.summary())
+
+metrics_server = None
+# Sharded workers other than the first find the shared caches already warm
+warm_caches = True
+metrics.registry.add_stats("bot_sub_cache", sub_cache)
+metrics.registry.add_stats("bot_chat_cache", chat_cache)
+metrics.registry.add_stats("bot_chat_usernames", chat_usernames)
+metrics.registry.add_stats("bot_singleflight", inflight)
+metrics.registry.add_stats("bot_membership", membership)
+# bot_store_usage{handler="..."} is how often each handler ran, across restarts
+metrics.registry.add_stats("bot_store", store, label="handler")
+metrics.registry.add_stats("bot_group_policy", group_policy)
+metrics.registry.add_stats("bot_keyboard", keyboards)
+metrics.registry.add_stats("bot_enrichment", enrichment)
+metrics.registry.add_stats("bot_logging", log_pipeline)
+metrics.registry.add_stats("bot_membership_breaker", membership_breaker, label="transition")
+
+UPDATE_GATE_GROUP = -10
+FLOOD_GUARD_GROUP = -1
+update_gate = None
+flood_guard = None
+
+@functools.cache
+def ssl_context():
+    """One TLS context for every request backend: loading the CA bundle takes tens of milliseconds"""
+    return httpx.create_ssl_context()
+
+def make_request(pool_size: int, http_version: str = None, keepalive_connections: int = None) -> metrics.InstrumentedRequest:
+    """A Bot API request backend configured from the HTTP_* settings"""
+    http_version = http_version or HTTP_VERSION
+    keepalive_connections = HTTP_KEEPALIVE_CONNECTIONS if keepalive_connections is None else keepalive_connections
+    kwargs = dict(
+        connection_pool_size=pool_size,
+        connect_timeout=HTTP_CONNECT_TIMEOUT,
+        read_timeout=HTTP_READ_TIMEOUT,
+        write_timeout=HTTP_WRITE_TIMEOUT,
+        pool_timeout=HTTP_POOL_TIMEOUT,
+        httpx_kwargs={"verify": ssl_context(), "limits": httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=min(keepalive_connections, pool_size),
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        )}
+    )
+    try:
+        return metrics.InstrumentedRequest(http_version=http_version, **kwargs)
+    except RuntimeError as e:
+        # HTTP/2 without the h2 package
+        logger.warning("%s Falling back to HTTP/1.1.", e)
+        return metrics.InstrumentedRequest(http_version="1.1", **kwargs)
+
+def build_application() -> Application:
+    """Build the Application and register all handlers"""
+    processor = OrderedUpdateProcessor(UPDATE_CONCURRENCY, UPDATE_QUEUE_DEPTH, UPDATE_FLOOD_POLICY)
+    limiter = FloodLimiter(RATE_OVERALL, RATE_PER_CHAT, RATE_PER_CHAT_BURST, RATE_GROUP_PER_MINUTE, RATE_MAX_RETRIES)
+    metrics.registry.add_stats("bot_updates", processor)
+    metrics.registry.add_stats("bot_ratelimit", limiter)
+    
+    # Long polling gets its own connections so it never holds up replies; every call is timed by method
+    builder = Application.builder().token(BOT_TOKEN).concurrent_updates(processor).rate_limiter(limiter).request(
+        make_request(HTTP_POOL_SIZE)
+    ).get_updates_request(
+        make_request(GET_UPDATES_POOL_SIZE)
+    ).post_init(on_startup).post_shutdown(on_shutdown)
+    if BOT_API_BASE_URL:
+        builder = builder.base_url(BOT_API_BASE_URL)
+    application = builder.build()
+    
+    # Command handlers
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("id", get_id_command))
+    application.add_handler(CommandHandler("info", get_id_command))
+    application.add_handler(CommandHandler("resolve", resolve_command))
+    
+    # Callback query handler for Force Sub check
+    application.add_handler(CallbackQueryHandler(handle_callback_query))
+    
+    # Inline mode: @bot in any chat
+    application.add_handler(InlineQueryHandler(handle_inline_query))
+    
+    # Track joins/leaves of the Force Sub channel
+    application.add_handler(ChatMemberHandler(handle_channel_member, ChatMemberHandler.CHAT_MEMBER))
+    application.job_queue.run_repeating(
+        reconcile_membership, interval=MEMBERSHIP_RECONCILE_INTERVAL, first=MEMBERSHIP_RECONCILE_INTERVAL
+    )
+    if METRICS_LOG_INTERVAL:
+        application.job_queue.run_repeating(log_metrics_summary, interval=METRICS_LOG_INTERVAL, first=METRICS_LOG_INTERVAL)
+    if not STARTUP_PROFILE:
+        application.job_queue.run_once(log_startup_time, when=0)
+    
+    # Handle user shared (from keyboard)
+    application.add_handler(MessageHandler(filters.StatusUpdate.USERS_SHARED, handle_user_shared))
+    
+    # Handle chat shared (from keyboard)
+    application.add_handler(MessageHandler(filters.StatusUpdate.CHAT_SHARED, handle_chat_shared))
+    
+    # Handle contacts
+    application.add_handler(MessageHandler(filters.CONTACT, handle_shared_contact))
+    
+    # Handle forwarded messages
+    application.add_handler(MessageHandler(filters.FORWARDED & ~filters.COMMAND, handle_forwarded_message))
+    
+    # Handle any other text messages
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
+    
+    # Error handler
+    application.add_error_handler(error_handler)
+    
+    # Runs before every other group: counts updates by type and drops types nobody handles
+    global update_gate
+    update_gate = UpdateTypeGate(required_update_types(application), max_age=UPDATE_MAX_AGE)
+    
+    # Time every handler registered above and count the updates they run for (all are in group 0)
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = metrics.instrument_handler(update_gate.count_handled(handler.callback))
+    
+    application.add_handler(update_gate.handler(), group=UPDATE_GATE_GROUP)
+    metrics.registry.add_stats("bot_update_types", update_gate, label="type")
+    
+    # Then, still before any handler could call Telegram: drops updates from flooding users
+    global flood_guard
+    flood_guard = FloodGuard(
+        FLOOD_USER_LIMIT, FLOOD_USER_WINDOW, FLOOD_BAN, FLOOD_BAN_MAX,
+        FLOOD_GLOBAL_RATE, FLOOD_MAX_USERS, FLOOD_IDLE_AFTER, exempt=ADMIN_IDS
+    )
+    application.add_handler(flood_guard.handler(), group=FLOOD_GUARD_GROUP)
+    metrics.registry.add_stats("bot_flood_guard", flood_guard)
+    
+    return application
+
+def updater_kwargs(allowed_updates: list) -> dict:
+    """Arguments for run_webhook/start_webhook or run_polling/start_polling, depending on BOT_MODE"""
+    if BOT_MODE == "webhook":
+        # Telegram keeps queuing updates while we redeploy; the update gate skips what is too old
+        return dict(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=allowed_updates,
+            drop_pending_updates=not UPDATE_MAX_AGE
+        )
+    # The backlog is fetched unless UPDATE_MAX_AGE is 0; the update gate skips what is too old
+    return dict(allowed_updates=allowed_updates, drop_pending_updates=not UPDATE_MAX_AGE)
+
+# ------------------- SHARDED MODE ----------------------
+
+SHARED_CACHES = ("sub_cache", "chat_cache", "chat_usernames")
+
+def use_shared_caches(shared: dict):
+    """Points this worker's subscription and chat caches at the mappings shared by all workers"""
+    global sub_cache, chat_cache, chat_usernames
+    sub_cache = SharedTTLCache(shared["sub_cache"], SUB_CACHE_SIZE, SUB_CACHE_TTL, SHARED_CACHE_LOCAL_TTL)
+    chat_cache = SharedTTLCache(shared["chat_cache"], CHAT_CACHE_SIZE, CHAT_CACHE_TTL, SHARED_CACHE_LOCAL_TTL)
+    chat_usernames = SharedTTLCache(shared["chat_usernames"], CHAT_CACHE_SIZE, CHAT_CACHE_TTL, SHARED_CACHE_LOCAL_TTL)
+    metrics.registry.add_stats("bot_sub_cache", sub_cache)
+    metrics.registry.add_stats("bot_chat_cache", chat_cache)
+    metrics.registry.add_stats("bot_chat_usernames", chat_usernames)
+
+async def run_shard(index: int, queue, shared: dict):
+    """Runs the handlers for the updates the front process routes to this worker"""
+    global warm_caches, METRICS_PORT, RATE_OVERALL
+    use_shared_caches(shared)
+    warm_caches = index == 0
+    if METRICS_PORT:
+        METRICS_PORT += index
+    # Telegram's overall limit is per bot, not per process
+    RATE_OVERALL /= BOT_SHARDS
+    
+    from sharding import feed_worker
+    application = build_application()
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    logger.info("🧩 Shard %s ready", index)
+    try:
+        await feed_worker(application, queue)
+    finally:
+        await application.stop()
+        await application.post_shutdown(application)
+        await application.shutdown()
+        for cache in (sub_cache, chat_cache, chat_usernames):
+            cache.close()
+        logger.info("🧩 Shard %s stopped", index)
+
+def shard_worker(index: int, queue, shared: dict):
+    """Entry point of a worker process"""
+    # The front process handles Ctrl+C/SIGTERM and then lets the workers drain their queues
+    from sharding import ignore_stop_signals
+    ignore_stop_signals()
+    asyncio.run(run_shard(index, queue, shared))
+
+async def run_front(application: Application, router: "ShardRouter", allowed_updates: list):
+    """Receives updates with the application's updater and routes them until SIGINT/SIGTERM"""
+    from sharding import STOP
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+    
+    await application.updater.initialize()
+    if BOT_MODE == "webhook":
+        await application.updater.start_webhook(**updater_kwargs(allowed_updates))
+    else:
+        await application.updater.start_polling(**updater_kwargs(allowed_updates))
+    routing = asyncio.create_task(router.run(application.update_queue))
+    logger.info("✅ Bot started successfully! Routing updates to %s shards...", len(router.queues))
+    
+    await stopping.wait()
+    logger.info("Stopping: draining shard queues...")
+    await application.updater.stop()
+    await application.update_queue.put(STOP)
+    await routing
+    await application.updater.shutdown()
+
+def run_sharded(application: Application, allowed_updates: list):
+    """Front process plus BOT_SHARDS worker processes sharing their caches through a manager process"""
+    import multiprocessing
+    from sharding import CacheManager, ShardRouter, ignore_stop_signals
+    context = multiprocessing.get_context("spawn")
+    manager = CacheManager(ctx=context)
+    manager.start(ignore_stop_signals)
+    shared = {name: manager.SharedMapping() for name in SHARED_CACHES}
+    queues = [context.Queue(SHARD_QUEUE_SIZE) for _ in range(BOT_SHARDS)]
+    workers = [
+        context.Process(target=shard_worker, args=(index, queue, shared), name=f"shard-{index}")
+        for index, queue in enumerate(queues)
+    ]
+    for worker in workers:
+        worker.start()
+    
+    router = ShardRouter(queues)
+    try:
+        asyncio.run(run_front(application, router, allowed_updates))
+    finally:
+        if not router.stopped:
+            for queue in queues:
+                queue.put(None)
+        for worker in workers:
+            worker.join()
+        manager.shutdown()
+        logger.info("Routed updates per shard: %s", router.stats()['routed'])
+
+async def profile_startup(application: Application):
+    """Goes through startup and shutdown without fetching updates, then prints where the time went"""
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    startup_timer.mark("start")
+    await application.stop()
+    await application.post_shutdown(application)
+    await application.shutdown()
+    
+    print(f"Startup phases:\n{startup_timer.report()}")
+    print("\nSlowest imports of bot.py (cumulative, fresh interpreter):")
+    for name, seconds in import_profile("bot", os.path.dirname(os.path.abspath(__file__))):
+        print(f"{name:<24} {seconds * 1000:9.1f} ms")
 
 def main():
     """Start the bot"""
     logger.info("🤖 Starting UserInfo Bot...")
     
     try:
-        application = Application.builder().token(BOT_TOKEN).build()
+        application = build_application()
+        allowed_updates = required_update_types(application)
+        startup_timer.mark("build_application")
+        logger.info("📬 Requesting update types: %s", ', '.join(allowed_updates))
         
-        # Command handlers
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("help", help_command))
-        application.add_handler(CommandHandler("id", get_id_command))
-        application.add_handler(CommandHandler("info", get_id_command))
-        
-        # Callback query handler for Force Sub check
-        application.add_handler(CallbackQueryHandler(handle_callback_query))
-        
-        # Handle user shared (from keyboard)
-        application.add_handler(MessageHandler(filters.StatusUpdate.USERS_SHARED, handle_user_shared))
-        
-        # Handle chat shared (from keyboard)
-        application.add_handler(MessageHandler(filters.StatusUpdate.CHAT_SHARED, handle_chat_shared))
-        
-        # Handle contacts
-        application.add_handler(MessageHandler(filters.CONTACT, handle_shared_contact))
-        
-        # Handle forwarded messages
-        application.add_handler(MessageHandler(filters.FORWARDED & ~filters.COMMAND, handle_forwarded_message))
-        
-        # Handle any other text messages
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
-        
-        # Error handler
-        application.add_error_handler(error_handler)
-        
-        logger.info("✅ Bot started successfully! Polling for updates...")
-        application.run_polling(
-            allowed_updates=Update.ALL_TYPES,
-            drop_pending_updates=True
-        )
+        if STARTUP_PROFILE:
+            asyncio.run(profile_startup(application))
+        elif BOT_SHARDS > 1:
+            run_sharded(application, allowed_updates)
+        elif BOT_MODE == "webhook":
+            logger.info("✅ Bot started successfully! Listening for webhooks on %s:%s/%s...", WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH)
+            application.run_webhook(**updater_kwargs(allowed_updates))
+        else:
+            logger.info("✅ Bot started successfully! Polling for updates...")
+            application.run_polling(**updater_kwargs(allowed_updates))
     except Exception as e:
-        logger.error(f"❌ Failed to start bot: {e}", exc_info=True)
+        logger.error("❌ Failed to start bot: %s", e, exc_info=True)
+
+startup_timer.mark("module setup")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,109 @@
+import logging
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# ------------------- CIRCUIT BREAKER ----------------------
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+# Numeric encoding for the state gauge
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while the breaker is open."""
+
+
+class CircuitBreaker:
+    """Stops calling an upstream that keeps failing.
+
+    After failure_threshold consecutive failures the breaker opens and every call is
+    refused for reset_timeout seconds. It then goes half-open and lets up to
+    half_open_probes calls through at a time; that many successes in a row close it
+    again, and any failure reopens it. is_failure decides which exceptions count.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 half_open_probes: int = 1, is_failure=lambda e: True):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.is_failure = is_failure
+
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+
+        self.short_circuited = 0
+        self.transitions = Counter()
+
+    def _transition(self, state: str):
+        self.transitions[f"{self.state}_to_{state}"] += 1
+        logger.warning("Circuit %s: %s -> %s", self.name, self.state, state)
+        self.state = state
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        self._probes = 0
+        self._probe_successes = 0
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now; callers must report its outcome."""
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_probes:
+                return False
+            self._probes += 1
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        if self.state == HALF_OPEN:
+            self._probe_successes += 1
+            self._probes -= 1
+            if self._probe_successes >= self.half_open_probes:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            self._transition(OPEN)
+
+    async def call(self, func):
+        """Awaits func() unless the breaker is open, in which case CircuitOpenError is raised."""
+        if not self.allow():
+            self.short_circuited += 1
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        try:
+            result = await func()
+        except Exception as e:
+            if self.is_failure(e):
+                self.record_failure()
+            else:
+                # Upstream answered, just not with what we wanted (e.g. a bad request)
+                self.record_success()
+            raise
+        except BaseException:
+            # Cancelled: says nothing about upstream, but frees the half-open probe slot
+            if self.state == HALF_OPEN:
+                self._probes -= 1
+            raise
+        self.record_success()
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "state": STATE_VALUES[self.state],
+            "consecutive_failures": self.failures,
+            "short_circuited": self.short_circuited,
+            "transitions": dict(self.transitions),
+        }
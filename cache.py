@@ -0,0 +1,258 @@
+import asyncio
+import logging
+import pickle
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# ------------------- IN-PROCESS CACHES ----------------------
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Size-bounded LRU cache where every entry carries its own expiry."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key, default=None, count=True):
+        """Returns the cached value for key, or default if absent or expired."""
+        entry = self._data.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return value
+            del self._data[key]
+        if count:
+            self.misses += 1
+        return default
+
+    async def aget(self, key, default=None, count=True):
+        """get for callers that also work with a SharedTTLCache."""
+        return self.get(key, default, count)
+
+    def set(self, key, value, ttl=None):
+        """Stores value under key for ttl seconds (defaults to the cache TTL)."""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        """Drops a single entry so the next lookup goes to the source."""
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SharedMapping(dict):
+    """The dict behind a SharedTTLCache, living in the process that holds it (e.g. a manager).
+
+    Values are (pickled value, wall-clock expiry) pairs. prune runs where the dict lives,
+    so entries never have to be shipped to the caller to be sorted out.
+    """
+
+    def prune(self, maxsize: int, now: float) -> int:
+        """Drops expired entries and then the soonest-expiring ones until maxsize is met; returns how many."""
+        if len(self) <= maxsize:
+            return 0
+        entries = sorted((expires_at, key) for key, (_, expires_at) in self.items())
+        excess = len(entries) - maxsize
+        evicted = 0
+        for expires_at, key in entries:
+            if expires_at > now and excess <= 0:
+                break
+            del self[key]
+            evicted += 1
+            excess -= 1
+        return evicted
+
+
+class SharedTTLCache:
+    """TTLCache interface over a SharedMapping shared between processes.
+
+    Reads are served from a local TTLCache, holding entries for at most local_ttl seconds
+    (or until they expire in the mapping); only local misses go to the mapping, and aget
+    does that on the loop's default executor. Writes update the local copy at once and
+    are written through to the mapping in order on a background thread, so a proxy (e.g.
+    a multiprocessing.Manager one) never blocks the event loop on them. If the mapping
+    fails (e.g. its manager process died), reads count as misses and writes are dropped.
+    Values are pickled on this side so the process holding the mapping never needs our
+    classes, and expiry uses wall-clock time since entries are written and read by
+    different processes. Size is enforced in batches: every prune_every writes the
+    mapping prunes itself to maxsize.
+    """
+
+    def __init__(self, shared, maxsize: int, ttl: float, local_ttl: float = 60.0, prune_every: int = 1000):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.prune_every = prune_every
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.read_errors = 0
+        self.write_errors = 0
+        self._shared = shared
+        self._local = TTLCache(maxsize=maxsize, ttl=local_ttl)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-cache")
+        self._writes = 0
+
+    def __len__(self):
+        return len(self._local)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key, default=None, count=True):
+        """Returns the cached value for key, or default if absent or expired.
+
+        A local miss waits on the mapping; code on the event loop uses aget.
+        """
+        value = self._local.get(key, _MISSING, count=False)
+        if value is _MISSING:
+            value = self._fetch(key)
+        return self._counted(value, default, count)
+
+    async def aget(self, key, default=None, count=True):
+        """get that reads the mapping off the event loop on a local miss."""
+        value = self._local.get(key, _MISSING, count=False)
+        if value is _MISSING:
+            value = await asyncio.get_running_loop().run_in_executor(None, self._fetch, key)
+        return self._counted(value, default, count)
+
+    def _fetch(self, key):
+        """The value for key from the mapping (kept locally from now on), or _MISSING."""
+        try:
+            entry = self._shared.get(key)
+        except Exception as e:
+            self.read_errors += 1
+            logger.warning("Shared cache read failed: %s", e)
+            return _MISSING
+        if entry is None:
+            return _MISSING
+        data, expires_at = entry
+        remaining = expires_at - time.time()
+        if remaining <= 0:
+            return _MISSING
+        value = pickle.loads(data)
+        self._local.set(key, value, ttl=min(remaining, self.local_ttl))
+        return value
+
+    def _counted(self, value, default, count: bool):
+        if value is _MISSING:
+            if count:
+                self.misses += 1
+            return default
+        if count:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        """Stores value under key for ttl seconds (defaults to the cache TTL)."""
+        ttl = self.ttl if ttl is None else ttl
+        self._local.set(key, value, ttl=min(ttl, self.local_ttl))
+        self._write(self._shared.__setitem__, key, (pickle.dumps(value), time.time() + ttl))
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            self._write(self._prune)
+
+    def _prune(self):
+        self.evictions += self._shared.prune(self.maxsize, time.time())
+
+    def _write(self, func, *args):
+        self._writer.submit(func, *args).add_done_callback(self._written)
+
+    def _written(self, future):
+        if future.exception() is not None:
+            self.write_errors += 1
+            logger.warning("Shared cache write failed: %s", future.exception())
+
+    def invalidate(self, key):
+        """Drops a single entry so the next lookup goes to the source."""
+        self._local.invalidate(key)
+        self._write(self._shared.pop, key, None)
+
+    def clear(self):
+        self._local.clear()
+        self._write(self._shared.clear)
+
+    def close(self):
+        """Waits for pending writes to reach the mapping."""
+        self._writer.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._local),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "read_errors": self.read_errors,
+            "write_errors": self.write_errors,
+        }
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one in-flight request.
+
+    Every caller awaiting a key that is already being fetched shares the result
+    (or exception) of the first call instead of issuing its own.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.saved = 0
+        self._inflight = {}
+
+    def __len__(self):
+        return len(self._inflight)
+
+    async def do(self, key, func):
+        """Awaits func() once per key for all concurrent callers."""
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.saved += 1
+        # Shielded so one cancelled waiter does not cancel the call for everyone else
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # Mark as retrieved even if every waiter went away
+
+    def stats(self) -> dict:
+        return {"inflight": len(self._inflight), "calls": self.calls, "saved": self.saved}
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# ------------------- DEFERRED ENRICHMENT ----------------------
+# Replies about shared users/chats go out at once with whatever the update itself
+# carries (at least the IDs). The get_chat lookups for the rest run afterwards from
+# the JobQueue, and each reply is edited in place once its lookups are done.
+
+
+class EnrichmentJob(NamedTuple):
+    """A sent reply to edit once the chats in chat_ids have been looked up.
+
+    render gets {chat_id: ChatInfo or the exception the lookup raised} and returns
+    the new text, or None to leave the reply as it is.
+    """
+    message: object
+    chat_ids: tuple
+    render: Callable
+
+
+class EnrichmentQueue:
+    """Works off EnrichmentJobs in JobQueue runs of up to batch_size jobs.
+
+    At most concurrency lookups are in flight at a time, each chat once per batch
+    however many replies wait for it. With max_pending jobs waiting, new jobs are
+    refused and their replies keep the IDs only. After stop(), nothing more is looked
+    up or edited.
+    """
+
+    def __init__(self, lookup, concurrency: int, batch_size: int, max_pending: int, edit_kwargs: dict = None):
+        self.lookup = lookup
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.edit_kwargs = edit_kwargs or {}
+        self._pending = deque()
+        self._scheduled = False
+        self._stopped = False
+        self._lookups = {}
+
+        self.submitted = 0
+        self.refused = 0
+        self.edited = 0
+        self.unchanged = 0
+        self.lookup_errors = 0
+        self.edit_errors = 0
+        self.discarded = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def submit(self, job_queue, job: EnrichmentJob) -> bool:
+        """Queues job; a run is scheduled on job_queue unless one is already due."""
+        if self._stopped or len(self._pending) >= self.max_pending:
+            self.refused += 1
+            return False
+        self._pending.append(job)
+        self.submitted += 1
+        if not self._scheduled:
+            self._scheduled = True
+            job_queue.run_once(self._run, 0, name="enrichment")
+        return True
+
+    def stop(self):
+        """Drops the jobs still waiting and cancels the lookups in flight, e.g. before shutdown."""
+        self._stopped = True
+        self.discarded += len(self._pending)
+        self._pending.clear()
+        for lookup in self._lookups.values():
+            lookup.cancel()
+
+    async def _run(self, context):
+        if self._stopped:
+            return
+        batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+        try:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            lookups = self._lookups = {}
+
+            async def lookup(chat_id):
+                async with semaphore:
+                    try:
+                        return await self.lookup(context, chat_id)
+                    except Exception as e:
+                        self.lookup_errors += 1
+                        logger.warning("Could not get_chat for %s: %s", chat_id, e)
+                        return e
+
+            for job in batch:
+                for chat_id in job.chat_ids:
+                    if chat_id not in lookups:
+                        lookups[chat_id] = asyncio.ensure_future(lookup(chat_id))
+            outcomes = await asyncio.gather(*(self._finish(context, job, lookups) for job in batch), return_exceptions=True)
+            for job, error in zip(batch, outcomes):
+                if error is None:
+                    continue
+                if self._stopped:
+                    # Its lookups were cancelled by stop()
+                    self.discarded += 1
+                else:
+                    logger.error("Enrichment of reply %s failed: %s", job.message.message_id, error, exc_info=error)
+        finally:
+            self._lookups = {}
+            # Whatever arrived meanwhile gets its own run, so other jobs get a turn in between. Not once
+            # the application is stopping: the JobQueue would start and then cancel that run.
+            if self._pending and not self._stopped and context.application.running:
+                context.job_queue.run_once(self._run, 0, name="enrichment")
+            else:
+                self._scheduled = False
+
+    async def _finish(self, context, job: EnrichmentJob, lookups: dict):
+        """Edits job's reply as soon as its own lookups are done."""
+        results = dict(zip(job.chat_ids, await asyncio.gather(*(lookups[chat_id] for chat_id in job.chat_ids))))
+        if self._stopped:
+            self.discarded += 1
+            return
+        text = job.render(results)
+        if text is None:
+            self.unchanged += 1
+            return
+        try:
+            await context.bot.edit_message_text(
+                text, chat_id=job.message.chat_id, message_id=job.message.message_id, **self.edit_kwargs
+            )
+            self.edited += 1
+        except Exception as e:
+            self.edit_errors += 1
+            logger.warning("Could not edit reply %s in %s: %s", job.message.message_id, job.message.chat_id, e)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "submitted": self.submitted,
+            "refused": self.refused,
+            "edited": self.edited,
+            "unchanged": self.unchanged,
+            "lookup_errors": self.lookup_errors,
+            "edit_errors": self.edit_errors,
+            "discarded": self.discarded,
+        }
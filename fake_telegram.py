@@ -0,0 +1,417 @@
+"""Local stand-in for the Telegram Bot API.
+
+Runs the bot without api.telegram.org. Start the stub first, then point the bot at it:
+
+    python fake_telegram.py --port 8081 --count 200 --batch 50
+    BOT_TOKEN=123:fake BOT_API_BASE_URL=http://127.0.0.1:8081/bot BOT_MODE=webhook \\
+        WEBHOOK_URL=http://127.0.0.1:8443 WEBHOOK_SECRET=s3cret python bot.py
+
+Once the bot registers its webhook, the stub POSTs the synthetic updates to it in batches
+and prints which API methods the bot called in response. loadtest.py drives the same stub
+in-process (polling or webhook) and reports throughput and reply latency.
+"""
+import argparse
+import asyncio
+import email
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {
+    "id": 1000000001, "is_bot": True, "first_name": "ID Bot", "username": "fake_id_bot",
+    "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": True,
+}
+
+# ------------------- REQUEST PARSING ----------------------
+
+def _decode(value):
+    # PTB sends every non-string parameter JSON-encoded
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+def parse_params(content_type, body) -> dict:
+    """Decodes the form or multipart body of a Bot API request."""
+    if not body:
+        return {}
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    if content_type.startswith("multipart/form-data"):
+        message = email.message_from_bytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+        params = {}
+        for part in message.get_payload():
+            name = part.get_param("name", header="content-disposition")
+            if part.get_filename() is None:
+                params[name] = _decode(part.get_payload(decode=True).decode())
+            else:
+                params[name] = f"<upload {part.get_filename()}>"
+        return params
+    return {key: _decode(value) for key, value in parse_qsl(body.decode())}
+
+# ------------------- FAKE BOT API ----------------------
+
+class TooManyRequests(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Too Many Requests: retry after {retry_after}")
+        self.retry_after = retry_after
+
+
+class ServerError(Exception):
+    pass
+
+
+# Housekeeping calls that are never delayed or failed on purpose
+CONTROL_METHODS = ("getMe", "getUpdates", "setWebhook", "deleteWebhook", "getWebhookInfo")
+
+
+class FakeBotAPI:
+    """Answers Bot API methods with canned results and records every call.
+
+    With flood_every=N every Nth send* call is answered with a 429 asking the bot
+    to retry after retry_after seconds. Every other call takes latency seconds (plus
+    up to jitter more) and fails with a 500 with probability error_rate.
+
+    Updates handed to push_updates() are served through getUpdates. Each pushed
+    update expects one reply in its chat; the delay until the bot's first send/edit
+    there is collected in reply_latencies. Like Telegram, it refuses to edit messages
+    that were sent with a reply keyboard.
+    """
+
+    def __init__(self, flood_every=0, retry_after=1, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.flood_every = flood_every
+        self.retry_after = retry_after
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._sends = 0
+        self.calls = Counter()
+        self.webhook = None
+        self.webhook_set = threading.Event()
+        self._lock = threading.Lock()
+        self._message_ids = itertools.count(1)
+        # (chat_id, message_id) of messages sent with a reply keyboard, which Telegram won't let the bot edit
+        self._keyboard_messages = set()
+        self.refused_edits = 0
+
+        self._updates = deque()
+        self._updates_ready = threading.Condition()
+        self._awaiting = defaultdict(deque)
+        self.reply_latencies = []
+        self.last_reply_at = None
+
+    # --- updates and replies ---
+
+    def expect_reply(self, chat_id, since=None):
+        with self._lock:
+            self._awaiting[chat_id].append(since or time.perf_counter())
+
+    def _record_reply(self, chat_id):
+        with self._lock:
+            waiting = self._awaiting.get(chat_id)
+            if not waiting:
+                return
+            now = time.perf_counter()
+            self.reply_latencies.append(now - waiting.popleft())
+            self.last_reply_at = now
+            if not waiting:
+                del self._awaiting[chat_id]
+
+    @property
+    def pending_replies(self) -> int:
+        with self._lock:
+            return sum(len(waiting) for waiting in self._awaiting.values())
+
+    def push_updates(self, updates):
+        """Queues updates for getUpdates and starts their reply clocks."""
+        for update in updates:
+            self.expect_reply(update_chat_id(update))
+        with self._updates_ready:
+            self._updates.extend(updates)
+            self._updates_ready.notify_all()
+
+    def get_updates(self, params) -> list:
+        """Long-polls like Telegram: confirms everything below offset, waits up to timeout for more."""
+        offset = params.get("offset") or 0
+        limit = params.get("limit") or 100
+        deadline = time.monotonic() + min(params.get("timeout") or 0, 10)
+        with self._updates_ready:
+            while self._updates and self._updates[0]["update_id"] < offset:
+                self._updates.popleft()
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._updates_ready.wait(remaining)
+            return list(itertools.islice(self._updates, limit))
+
+    def message(self, params) -> dict:
+        chat_id = params.get("chat_id", 0)
+        with self._lock:
+            message_id = next(self._message_ids)
+        result = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if isinstance(chat_id, int) and chat_id > 0 else "supergroup"},
+            "from": BOT_USER,
+        }
+        if "text" in params:
+            result["text"] = params["text"]
+        if "caption" in params:
+            result["caption"] = params["caption"]
+        if "photo" in params:
+            result["photo"] = [{"file_id": "fake-photo-file-id", "file_unique_id": "fake-photo", "width": 640, "height": 480}]
+        return result
+
+    def handle(self, method, params):
+        """Returns the result for one API call.
+
+        Raises TooManyRequests to simulate flood control and ServerError for injected failures.
+        """
+        with self._lock:
+            self.calls[method] += 1
+            if self.flood_every and method.startswith("send"):
+                self._sends += 1
+                if self._sends % self.flood_every == 0:
+                    self.calls["429"] += 1
+                    raise TooManyRequests(self.retry_after)
+            failed = method not in CONTROL_METHODS and self.error_rate and self._random.random() < self.error_rate
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+            if failed:
+                self.calls["500"] += 1
+
+        if method not in CONTROL_METHODS and delay:
+            time.sleep(delay)
+        if failed:
+            raise ServerError("Internal Server Error")
+
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            return self.get_updates(params)
+        if method == "setWebhook":
+            self.webhook = params
+            self.webhook_set.set()
+            return True
+        if method == "deleteWebhook":
+            self.webhook = None
+            return True
+        if method == "getWebhookInfo":
+            return {
+                "url": (self.webhook or {}).get("url", ""),
+                "has_custom_certificate": False,
+                "pending_update_count": 0,
+            }
+        if method == "getChatMember":
+            user_id = params["user_id"]
+            return {"status": "member", "user": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}}
+        if method == "getChat":
+            chat_id = params["chat_id"]
+            if isinstance(chat_id, int) and chat_id > 0:
+                return {"id": chat_id, "type": "private", "first_name": f"User {chat_id}",
+                        "accent_color_id": 0, "max_reaction_count": 11}
+            if isinstance(chat_id, str):
+                # @usernames resolve to a stable made-up id; names containing "missing" do not exist
+                if "missing" in chat_id:
+                    raise ValueError("chat not found")
+                return {"id": -1001000000000 - zlib.crc32(chat_id.encode()) % 10**9, "type": "channel",
+                        "title": f"Channel {chat_id}", "username": chat_id.lstrip("@"),
+                        "accent_color_id": 0, "max_reaction_count": 11}
+            return {"id": chat_id, "type": "supergroup",
+                    "title": f"Chat {chat_id}", "accent_color_id": 0, "max_reaction_count": 11}
+        if method.startswith(("send", "edit")):
+            if method.startswith("edit") and (params.get("chat_id"), params.get("message_id")) in self._keyboard_messages:
+                with self._lock:
+                    self.refused_edits += 1
+                raise ValueError("message can't be edited")
+            if "chat_id" in params:
+                self._record_reply(params["chat_id"])
+            result = self.message(params)
+            reply_markup = params.get("reply_markup")
+            if method.startswith("send") and isinstance(reply_markup, dict) and "keyboard" in reply_markup:
+                with self._lock:
+                    self._keyboard_messages.add((result["chat"]["id"], result["message_id"]))
+            return result
+        return True
+
+
+def make_handler(api: FakeBotAPI):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out as separate writes; without this every reply waits on a delayed ACK
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            # Paths look like /bot<token>/<method>
+            method = self.path.rstrip("/").rsplit("/", 1)[-1]
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            try:
+                payload = {"ok": True, "result": api.handle(method, parse_params(self.headers.get("Content-Type", ""), body))}
+            except TooManyRequests as e:
+                payload = {"ok": False, "error_code": 429, "description": str(e),
+                           "parameters": {"retry_after": e.retry_after}}
+            except ServerError as e:
+                payload = {"ok": False, "error_code": 500, "description": str(e)}
+            except Exception as e:
+                payload = {"ok": False, "error_code": 400, "description": f"Bad Request: {e}"}
+            data = json.dumps(payload).encode()
+            self.send_response(payload.get("error_code", 200))
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            try:
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                # The bot gave up on a long poll while shutting down
+                pass
+
+        do_GET = do_POST
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(api: FakeBotAPI, host="127.0.0.1", port=8081) -> ThreadingHTTPServer:
+    """Starts the stub in a background thread and returns the server."""
+    server = ThreadingHTTPServer((host, port), make_handler(api))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# ------------------- SYNTHETIC UPDATES ----------------------
+
+def _message_update(update_id, user_id, chat_id=None, **fields) -> dict:
+    chat_id = chat_id or user_id
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+        "chat": {"id": chat_id, "type": "private"} if chat_id > 0 else {"id": chat_id, "type": "supergroup", "title": f"Chat {chat_id}"},
+        **fields,
+    }
+    return {"update_id": update_id, "message": message}
+
+
+def make_message_update(update_id, user_id, text, chat_id=None) -> dict:
+    """A plain text (or /command) message update as Telegram would deliver it."""
+    update = _message_update(update_id, user_id, chat_id, text=text)
+    if text.startswith("/"):
+        update["message"]["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return update
+
+
+def make_users_shared_update(update_id, user_id, shared_ids, request_id=1, with_names=True) -> dict:
+    """A users_shared service message, as sent after the user picks users from a keyboard button."""
+    users = [
+        {"user_id": shared_id, "first_name": f"User {shared_id}", "username": f"user{shared_id}"} if with_names
+        else {"user_id": shared_id}
+        for shared_id in shared_ids
+    ]
+    return _message_update(update_id, user_id, users_shared={"request_id": request_id, "users": users})
+
+
+def make_chat_shared_update(update_id, user_id, shared_chat_id, request_id=5, with_title=True) -> dict:
+    """A chat_shared service message; request_id picks the keyboard button (see main_keyboard in bot.py)."""
+    chat_shared = {"request_id": request_id, "chat_id": shared_chat_id}
+    if with_title:
+        chat_shared.update(title=f"Chat {shared_chat_id}", username=f"chat{abs(shared_chat_id)}")
+    return _message_update(update_id, user_id, chat_shared=chat_shared)
+
+
+def make_forwarded_update(update_id, user_id, origin_id, text="forwarded") -> dict:
+    """A message forwarded from a user (origin_id > 0) or a channel (origin_id < 0)."""
+    if origin_id > 0:
+        origin = {"type": "user", "date": int(time.time()),
+                  "sender_user": {"id": origin_id, "is_bot": False, "first_name": f"User {origin_id}"}}
+    else:
+        origin = {"type": "channel", "date": int(time.time()), "message_id": 1,
+                  "chat": {"id": origin_id, "type": "channel", "title": f"Channel {origin_id}"}}
+    return _message_update(update_id, user_id, text=text, forward_origin=origin)
+
+
+def update_chat_id(update: dict):
+    """The chat a reply to this update goes to."""
+    return update["message"]["chat"]["id"]
+
+
+async def post_updates(url, updates, secret_token=None, concurrency=50) -> list:
+    """POSTs updates to a webhook like Telegram does, up to concurrency at a time.
+
+    Returns the per-update delivery latency in seconds.
+    """
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret_token} if secret_token else {}
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        async def deliver(update):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(url, json=update, headers=headers)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(deliver(update) for update in updates))
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--count", type=int, default=100, help="number of updates to deliver")
+    parser.add_argument("--batch", type=int, default=50, help="updates delivered concurrently")
+    parser.add_argument("--users", type=int, default=20, help="distinct synthetic users")
+    parser.add_argument("--flood-every", type=int, default=0, help="answer every Nth send with a 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after sent with each 429")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every API call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra seconds per call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of API calls answered with a 500")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    api = FakeBotAPI(args.flood_every, args.retry_after, args.latency, args.jitter, args.error_rate)
+    serve(api, args.host, args.port)
+    logger.info(f"Fake Bot API listening on http://{args.host}:{args.port}/bot — waiting for setWebhook...")
+    api.webhook_set.wait()
+    logger.info(f"Webhook registered: {api.webhook.get('url')}")
+
+    updates = [
+        make_message_update(i, 10_000 + i % args.users, "/start" if i % 5 == 0 else "hello")
+        for i in range(1, args.count + 1)
+    ]
+    started = time.perf_counter()
+    latencies = asyncio.run(post_updates(api.webhook["url"], updates, api.webhook.get("secret_token"), args.batch))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    logger.info(
+        f"Delivered {len(updates)} updates in {elapsed:.2f}s ({len(updates) / elapsed:.1f}/s), "
+        f"p50 {latencies[len(latencies) // 2] * 1000:.1f}ms, p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms"
+    )
+    # Keep answering API calls until the bot has worked through the backlog
+    try:
+        while True:
+            time.sleep(5)
+            logger.info(f"API calls made by the bot: {dict(api.calls)}")
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import logging
+import time
+from array import array
+from collections import Counter, OrderedDict
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, TypeHandler
+
+from processing import update_type
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# ------------------- INBOUND FLOOD GUARD ----------------------
+
+# Updates a user sends on purpose. Member updates are Telegram's bookkeeping (and feed the
+# membership index); inline queries arrive per keystroke and are answered from Telegram's cache.
+GUARDED_TYPES = frozenset({"message", "edited_message", "callback_query"})
+
+
+class UserWindow:
+    """One user's last `limit` update times in a ring buffer, plus their ban state."""
+
+    __slots__ = ("times", "next", "strikes", "banned_until", "last_seen")
+
+    def __init__(self, limit: int):
+        self.times = array("d", [float("-inf")]) * limit
+        self.next = 0
+        self.strikes = 0
+        self.banned_until = 0.0
+        self.last_seen = 0.0
+
+    def record(self, now: float, window: float) -> bool:
+        """Adds an update at now; False if it is one more than the buffer holds within window."""
+        if now - self.times[self.next] < window:
+            return False
+        self.times[self.next] = now
+        self.next = (self.next + 1) % len(self.times)
+        return True
+
+
+class FloodGuard:
+    """Drops updates from users who send too many, before any handler (or API call) runs.
+
+    Each user may send limit updates per sliding window seconds. The first update over
+    that bans them for ban seconds, doubling with every further ban up to max_ban; the
+    strikes are forgotten once the user has been idle for idle_after seconds and their
+    state is evicted. On top of that, at most global_rate updates per second are let in
+    overall (0 for no cap). At most max_users users are tracked, least recently active
+    evicted first. Users in exempt are never limited.
+    """
+
+    def __init__(self, limit: int = 20, window: float = 10.0, ban: float = 60.0, max_ban: float = 3600.0,
+                 global_rate: float = 0, max_users: int = 50000, idle_after: float = 600.0, exempt=()):
+        self.limit = limit
+        self.window = window
+        self.ban = ban
+        self.max_ban = max_ban
+        self.max_users = max_users
+        self.idle_after = idle_after
+        self.exempt = frozenset(exempt)
+        self._global = TokenBucket(global_rate, global_rate) if global_rate else None
+        # Least recently active first
+        self._users = OrderedDict()
+
+        self.admitted = 0
+        self.dropped = Counter()
+        self.bans = 0
+        self.evicted = 0
+
+    def _evict(self, now: float, steps: int = 4):
+        """Forgets a few users idle for idle_after (unless still banned), and any beyond max_users."""
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+            self.evicted += 1
+        for _ in range(min(steps, len(self._users))):
+            user_id, state = next(iter(self._users.items()))
+            if now - state.last_seen < self.idle_after:
+                return
+            if state.banned_until > now:
+                # Quiet but still banned: look at it again after the others
+                self._users.move_to_end(user_id)
+                continue
+            del self._users[user_id]
+            self.evicted += 1
+
+    def admit(self, user_id, now: float = None) -> str:
+        """"ok" if the update may be handled, else why it is dropped."""
+        if now is None:
+            now = time.monotonic()
+        self._evict(now)
+
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = UserWindow(self.limit)
+        else:
+            self._users.move_to_end(user_id)
+        state.last_seen = now
+
+        if state.banned_until > now:
+            return "banned"
+        if not state.record(now, self.window):
+            state.strikes += 1
+            duration = min(self.ban * 2 ** (state.strikes - 1), self.max_ban)
+            state.banned_until = now + duration
+            self.bans += 1
+            logger.warning("🚫 User %s sent over %s updates in %gs, ignored for %gs", user_id, self.limit, self.window, duration)
+            return "rate_limited"
+        if self._global and self._global.take(now):
+            return "over_capacity"
+        return "ok"
+
+    async def __call__(self, update: Update, context) -> None:
+        user = update.effective_user
+        if user is None or user.id in self.exempt or update_type(update) not in GUARDED_TYPES:
+            return
+        verdict = self.admit(user.id)
+        if verdict != "ok":
+            self.dropped[verdict] += 1
+            raise ApplicationHandlerStop
+        self.admitted += 1
+
+    def handler(self) -> TypeHandler:
+        return TypeHandler(Update, self)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._users),
+            "admitted": self.admitted,
+            "dropped": dict(self.dropped),
+            "bans": self.bans,
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,67 @@
+from telegram import MessageEntity
+
+from cache import TTLCache
+
+# ------------------- GROUP REPLY POLICY ----------------------
+
+def is_addressed_to(message, bot) -> bool:
+    """True if a group message mentions the bot or replies to one of its messages."""
+    reply = message.reply_to_message
+    if reply and reply.from_user and reply.from_user.id == bot.id:
+        return True
+    username = f"@{bot.username}".lower()
+    for entity, text in message.parse_entities([MessageEntity.MENTION, MessageEntity.TEXT_MENTION]).items():
+        if entity.type == MessageEntity.TEXT_MENTION:
+            if entity.user and entity.user.id == bot.id:
+                return True
+        elif text.lower() == username:
+            return True
+    return False
+
+
+class GroupPolicy:
+    """Decides whether the bot answers a message in a group at all.
+
+    Only messages addressed to the bot (a command, a mention or a reply to it) are
+    answered. After answering, a chat gets no further answer for cooldown seconds,
+    and the same answer (identified by the caller's key, e.g. the sender) is not
+    repeated in a chat within dedup_window seconds.
+    """
+
+    def __init__(self, cooldown: float, dedup_window: float, max_chats: int = 10000):
+        self.cooldown = cooldown
+        self.dedup_window = dedup_window
+        self._cooling = TTLCache(maxsize=max_chats, ttl=cooldown)
+        self._answered = TTLCache(maxsize=max_chats * 10, ttl=dedup_window)
+
+        self.allowed = 0
+        self.unaddressed = 0
+        self.cooled_down = 0
+        self.duplicates = 0
+
+    def allow(self, chat_id, key, addressed: bool = True) -> bool:
+        """Whether to answer now; an allowed answer starts the chat's cooldown and dedup window."""
+        if not addressed:
+            self.unaddressed += 1
+            return False
+        if self.dedup_window and (chat_id, key) in self._answered:
+            self.duplicates += 1
+            return False
+        if self.cooldown and chat_id in self._cooling:
+            self.cooled_down += 1
+            return False
+
+        self.allowed += 1
+        if self.cooldown:
+            self._cooling.set(chat_id, True)
+        if self.dedup_window:
+            self._answered.set((chat_id, key), True)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "allowed": self.allowed,
+            "unaddressed": self.unaddressed,
+            "cooled_down": self.cooled_down,
+            "duplicates": self.duplicates,
+        }
@@ -0,0 +1,45 @@
+from cache import TTLCache
+
+# ------------------- REPLY KEYBOARD STATE ----------------------
+
+SHOWN = True
+REMOVED = False
+
+
+class KeyboardTracker:
+    """Remembers per chat whether the bot's reply keyboard is showing.
+
+    Telegram keeps a reply keyboard until a message removes it, so replies only need
+    to attach it when the chat is not known to show it already. States expire after
+    resend_after seconds (and unknown chats count as not showing it), so a keyboard
+    lost on the client side comes back at least that often.
+    """
+
+    def __init__(self, maxsize: int, resend_after: float):
+        self._state = TTLCache(maxsize=maxsize, ttl=resend_after)
+
+        self.sent = 0
+        self.skipped = 0
+        self.removed = 0
+
+    def markup(self, chat_id, keyboard, force: bool = False):
+        """keyboard if chat_id needs it (or force), else None. Call mark_shown once it was sent."""
+        if not force and self._state.get(chat_id) is SHOWN:
+            self.skipped += 1
+            return None
+        return keyboard
+
+    def mark_shown(self, chat_id):
+        self._state.set(chat_id, SHOWN)
+        self.sent += 1
+
+    def needs_removal(self, chat_id) -> bool:
+        """Whether the chat may still show the keyboard (removal not already sent)."""
+        return self._state.get(chat_id) is not REMOVED
+
+    def mark_removed(self, chat_id):
+        self._state.set(chat_id, REMOVED)
+        self.removed += 1
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "skipped": self.skipped, "removed": self.removed, "chats": len(self._state)}
@@ -0,0 +1,258 @@
+"""Offline load test: replays synthetic updates through bot.py against the fake Bot API.
+
+Runs the real handlers in-process with no network access:
+
+    python loadtest.py --rate 200 --count 2000 --users 500
+    python loadtest.py --mode webhook --latency 0.05 --error-rate 0.01 --output run.json
+    python loadtest.py --compare run.json      # exits 1 if throughput, p99 or API calls regressed
+
+Each update expects exactly one reply; reply latency runs from the moment the update is
+offered (queued for getUpdates or POSTed to the webhook) to the bot's first send/edit in
+that chat.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+import httpx
+
+import fake_telegram
+
+logger = logging.getLogger("loadtest")
+
+DEFAULT_MIX = "start=1,users_shared=1,chat_shared=1,forwarded=1,text=1"
+
+# ------------------- UPDATE MIX ----------------------
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name not in UPDATE_MAKERS:
+            raise ValueError(f"Unknown update kind: {name} (choose from {', '.join(UPDATE_MAKERS)})")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def make_updates(count: int, users: int, mix: dict, seed=None) -> list:
+    """count updates from users distinct users, drawn from the weighted mix."""
+    rng = random.Random(seed)
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=count)
+    return [
+        UPDATE_MAKERS[kind](update_id, 10_000 + rng.randrange(users), rng)
+        for update_id, kind in enumerate(kinds, start=1)
+    ]
+
+
+def _chat_shared(update_id, user_id, rng):
+    # Plain "Group" shares (request_id 4) carry no chat type and cost a getChat
+    request_id = rng.choice((4, 5, 6))
+    return fake_telegram.make_chat_shared_update(update_id, user_id, -1001000000000 - rng.randrange(1000), request_id)
+
+
+UPDATE_MAKERS = {
+    "start": lambda update_id, user_id, rng: fake_telegram.make_message_update(update_id, user_id, "/start"),
+    "users_shared": lambda update_id, user_id, rng: fake_telegram.make_users_shared_update(
+        update_id, user_id, [rng.randrange(1, 10**9)], with_names=rng.random() < 0.5
+    ),
+    "chat_shared": _chat_shared,
+    "forwarded": lambda update_id, user_id, rng: fake_telegram.make_forwarded_update(
+        update_id, user_id, rng.choice((1, -1)) * rng.randrange(1, 10**9)
+    ),
+    "text": lambda update_id, user_id, rng: fake_telegram.make_message_update(update_id, user_id, "hello"),
+}
+
+# ------------------- DRIVER ----------------------
+
+async def replay(updates: list, rate: float, deliver):
+    """Offers the updates at rate per second (all at once if rate is 0)."""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    for i, update in enumerate(updates):
+        if rate:
+            delay = started + i / rate - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        deliver(update)
+
+
+async def wait_for_replies(api: fake_telegram.FakeBotAPI, timeout: float):
+    deadline = time.monotonic() + timeout
+    while api.pending_replies and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+
+
+async def run(args, api: fake_telegram.FakeBotAPI, updates: list) -> float:
+    """Starts the bot against the stub, replays the updates and returns the time they started."""
+    import bot
+
+    application = bot.build_application()
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+
+    tasks = set()
+    try:
+        if args.mode == "webhook":
+            await application.updater.start_webhook(
+                listen="127.0.0.1", port=args.webhook_port, url_path="telegram",
+                webhook_url=f"http://127.0.0.1:{args.webhook_port}/telegram", secret_token="loadtest",
+                allowed_updates=bot.required_update_types(application)
+            )
+            client = httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=args.webhook_connections))
+
+            async def post(update):
+                response = await client.post(
+                    f"http://127.0.0.1:{args.webhook_port}/telegram", json=update,
+                    headers={"X-Telegram-Bot-Api-Secret-Token": "loadtest"}
+                )
+                response.raise_for_status()
+
+            def deliver(update):
+                api.expect_reply(fake_telegram.update_chat_id(update))
+                task = asyncio.create_task(post(update))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        else:
+            await application.updater.start_polling(
+                poll_interval=0, timeout=1, allowed_updates=bot.required_update_types(application)
+            )
+            client = None
+
+            def deliver(update):
+                api.push_updates([update])
+
+        started = time.perf_counter()
+        await replay(updates, args.rate, deliver)
+        if tasks:
+            await asyncio.gather(*tasks)
+        await wait_for_replies(api, args.timeout)
+        return started
+    finally:
+        if client:
+            await client.aclose()
+        await application.updater.stop()
+        await application.stop()
+        await application.post_shutdown(application)
+        await application.shutdown()
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def report(api: fake_telegram.FakeBotAPI, count: int, started: float) -> dict:
+    latencies = api.reply_latencies
+    elapsed = (api.last_reply_at or time.perf_counter()) - started
+    work_calls = {
+        method: calls for method, calls in api.calls.items()
+        if method not in fake_telegram.CONTROL_METHODS and not method.isdigit()
+    }
+    return {
+        "updates": count,
+        "answered": len(latencies),
+        "elapsed": round(elapsed, 3),
+        "updates_per_second": round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "api_calls_per_update": round(sum(work_calls.values()) / count, 3),
+        "api_calls": dict(sorted(work_calls.items())),
+        "injected": {"429": api.calls["429"], "500": api.calls["500"]},
+        "refused_edits": api.refused_edits,
+    }
+
+
+def regressions(result: dict, baseline: dict, tolerance: float) -> list:
+    """Human-readable list of metrics that got worse than baseline by more than tolerance."""
+    problems = []
+    if result["updates_per_second"] < baseline["updates_per_second"] * (1 - tolerance):
+        problems.append(f"throughput {result['updates_per_second']}/s < baseline {baseline['updates_per_second']}/s")
+    if result["p99_ms"] > baseline["p99_ms"] * (1 + tolerance):
+        problems.append(f"p99 {result['p99_ms']}ms > baseline {baseline['p99_ms']}ms")
+    if result["api_calls_per_update"] > baseline["api_calls_per_update"] * (1 + tolerance):
+        problems.append(f"API calls/update {result['api_calls_per_update']} > baseline {baseline['api_calls_per_update']}")
+    if result["answered"] < result["updates"] and baseline["answered"] == baseline["updates"]:
+        problems.append(f"only {result['answered']}/{result['updates']} updates answered")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay synthetic updates through bot.py against a fake Bot API")
+    parser.add_argument("--mode", choices=("polling", "webhook"), default="polling")
+    parser.add_argument("--count", type=int, default=1000, help="number of updates to replay")
+    parser.add_argument("--rate", type=float, default=200, help="updates offered per second (0 = all at once)")
+    parser.add_argument("--users", type=int, default=200, help="distinct synthetic users")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weighted update kinds (default {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every API call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra seconds per call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of API calls answered with a 500")
+    parser.add_argument("--flood-every", type=int, default=0, help="answer every Nth send with a 429")
+    parser.add_argument("--keep-rate-limits", action="store_true",
+                        help="keep the bot's outbound flood limits and inbound flood guard (by default they are lifted to measure the bot itself)")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds to wait for outstanding replies")
+    parser.add_argument("--api-port", type=int, default=8091)
+    parser.add_argument("--webhook-port", type=int, default=8491)
+    parser.add_argument("--webhook-connections", type=int, default=40)
+    parser.add_argument("--output", help="write the result as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier --output run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression against --compare")
+    args = parser.parse_args()
+
+    # bot.py reads its configuration at import time
+    os.environ.setdefault("BOT_TOKEN", "123:loadtest")
+    os.environ["BOT_API_BASE_URL"] = f"http://127.0.0.1:{args.api_port}/bot"
+    os.environ.setdefault("STORE_PATH", ":memory:")
+    os.environ.setdefault("METRICS_PORT", "0")
+    os.environ.setdefault("METRICS_LOG_INTERVAL", "0")
+    os.environ.setdefault("LOG_FORMAT", "text")
+    if not args.keep_rate_limits:
+        for name in ("RATE_OVERALL", "RATE_PER_CHAT", "RATE_GROUP_PER_MINUTE"):
+            os.environ.setdefault(name, "1000000")
+        os.environ.setdefault("RATE_PER_CHAT_BURST", "1000000")
+        os.environ.setdefault("FLOOD_USER_LIMIT", "1000000")
+        os.environ.setdefault("FLOOD_GLOBAL_RATE", "0")
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    api = fake_telegram.FakeBotAPI(args.flood_every, 1, args.latency, args.jitter, args.error_rate, seed=args.seed)
+    server = fake_telegram.serve(api, port=args.api_port)
+    updates = make_updates(args.count, args.users, parse_mix(args.mix), seed=args.seed)
+    logger.info(f"Replaying {args.count} updates at {args.rate or 'max'}/s over {args.mode}...")
+    try:
+        started = asyncio.run(run(args, api, updates))
+    finally:
+        server.shutdown()
+
+    result = report(api, args.count, started)
+    logger.info(
+        f"{result['answered']}/{result['updates']} answered in {result['elapsed']}s: "
+        f"{result['updates_per_second']} updates/s, p50 {result['p50_ms']}ms, p99 {result['p99_ms']}ms, "
+        f"{result['api_calls_per_update']} API calls/update {result['api_calls']}, injected {result['injected']}, "
+        f"{result['refused_edits']} edits refused"
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            problems = regressions(result, json.load(f), args.tolerance)
+        for problem in problems:
+            logger.error(f"Regression: {problem}")
+        if problems:
+            sys.exit(1)
+        logger.info("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# ------------------- LOGGING PIPELINE ----------------------
+# Code on the event loop only samples and enqueues log records. Rendering the message and
+# its arguments, formatting tracebacks and writing to the stream all happen on the
+# QueueListener's thread.
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else on a record came in through extra=
+RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+class Truncated:
+    """A log argument rendered (JSON for Telegram objects) only when the record is formatted, cut to limit chars."""
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit: int):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        text = self.value.to_json() if hasattr(self.value, "to_json") else str(self.value)
+        if len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}… (+{len(text) - self.limit} chars)"
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, extra= fields and the traceback."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The classic one-line layout, noting how many records the sampler held back."""
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        text = super().formatMessage(record)
+        suppressed = getattr(record, "suppressed", 0)
+        return f"{text} ({suppressed} similar suppressed)" if suppressed else text
+
+
+class CallSiteSampler(logging.Filter):
+    """Lets each call site (file and line) log at most burst records per interval seconds.
+
+    The first record a call site logs after some were held back carries suppressed=<count>,
+    so an error storm shows up as a few full records plus counts instead of thousands.
+    """
+
+    def __init__(self, burst: int, interval: float):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        # (pathname, lineno) -> [window start, records let through, records held back]
+        self._sites = {}
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.pathname, record.lineno)
+        site = self._sites.get(key)
+        if site is None or record.created - site[0] >= self.interval:
+            if site is not None and site[2]:
+                record.suppressed = site[2]
+            self._sites[key] = [record.created, 1, 0]
+            return True
+        if site[1] < self.burst:
+            site[1] += 1
+            return True
+        site[2] += 1
+        self.suppressed += 1
+        return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Puts records on a bounded queue without ever waiting; with the queue full they are dropped."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Nothing is rendered here: the message (with Truncated arguments), the traceback and
+        # the final layout are all formatted on the listener's thread. That relies on logged
+        # arguments not changing afterwards, which holds for PTB objects (frozen), exceptions
+        # and plain values. The copy keeps other handlers from seeing our changes.
+        return copy.copy(record)
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """Root logging through a sampled, bounded queue to a writer thread."""
+
+    def __init__(self, level="INFO", fmt: str = "json", sample_burst: int = 10, sample_interval: float = 60.0,
+                 queue_size: int = 10000, stream=None):
+        self.level = level
+        self.formatter = JsonFormatter() if fmt == "json" else TextFormatter(TEXT_FORMAT)
+        self.sampler = CallSiteSampler(sample_burst, sample_interval) if sample_burst else None
+        self.queue = queue.Queue(queue_size)
+        self.handler = NonBlockingQueueHandler(self.queue)
+        if self.sampler:
+            self.handler.addFilter(self.sampler)
+        writer = logging.StreamHandler(stream or sys.stderr)
+        writer.setFormatter(self.formatter)
+        self.listener = QueueListener(self.queue, writer)
+        self._running = False
+
+    def start(self):
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(self.level)
+        self.listener.start()
+        self._running = True
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Writes out whatever is still queued and detaches from the root logger."""
+        if not self._running:
+            return
+        logging.getLogger().removeHandler(self.handler)
+        self.listener.stop()
+        self._running = False
+        atexit.unregister(self.stop)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "dropped": self.handler.dropped,
+            "suppressed": self.sampler.suppressed if self.sampler else 0,
+        }
@@ -0,0 +1,88 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# ------------------- CHANNEL MEMBERSHIP INDEX ----------------------
+
+MEMBER_STATUSES = ("member", "administrator", "creator")
+
+
+def is_member_status(chat_member) -> bool:
+    """True for a ChatMember that counts as subscribed (restricted members may still be in the channel)."""
+    if chat_member.status in MEMBER_STATUSES:
+        return True
+    return chat_member.status == "restricted" and bool(getattr(chat_member, "is_member", False))
+
+
+class MembershipIndex:
+    """Local view of who is in the force-sub channel, kept current by chat_member updates.
+
+    Only join/leave events and reconcile checks write here, so a known user can be
+    answered without calling get_chat_member. Entries are bounded by max_size
+    (least recently confirmed dropped first) and are re-verified by the reconcile
+    job once they are older than max_age, which catches events missed while the
+    bot was down.
+    """
+
+    def __init__(self, max_size: int, max_age: float):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._members = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.events = 0
+        self.reconciled = 0
+        self.corrections = 0
+
+    def __len__(self):
+        return len(self._members)
+
+    def get(self, user_id) -> Optional[bool]:
+        """Membership if known, else None."""
+        entry = self._members.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def set(self, user_id, is_member: bool):
+        self._members[user_id] = (is_member, time.monotonic())
+        self._members.move_to_end(user_id)
+        while len(self._members) > self.max_size:
+            self._members.popitem(last=False)
+
+    def discard(self, user_id):
+        self._members.pop(user_id, None)
+
+    def record_event(self, user_id, is_member: bool):
+        self.events += 1
+        self.set(user_id, is_member)
+
+    def record_reconcile(self, user_id, is_member: bool):
+        self.reconciled += 1
+        entry = self._members.get(user_id)
+        if entry is not None and entry[0] != is_member:
+            self.corrections += 1
+        self.set(user_id, is_member)
+
+    def stale(self, limit: int) -> list:
+        """Up to limit user ids whose status was last confirmed more than max_age ago, oldest first."""
+        cutoff = time.monotonic() - self.max_age
+        stale = []
+        for user_id, (_, updated_at) in self._members.items():
+            if updated_at > cutoff or len(stale) >= limit:
+                break
+            stale.append(user_id)
+        return stale
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._members),
+            "hits": self.hits,
+            "misses": self.misses,
+            "events": self.events,
+            "reconciled": self.reconciled,
+            "corrections": self.corrections,
+        }
@@ -0,0 +1,215 @@
+import asyncio
+import bisect
+import logging
+import time
+from collections import defaultdict
+
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# ------------------- METRICS ----------------------
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = defaultdict(float)
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] += amount
+
+    def expose(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with fixed buckets."""
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self.series = {}
+
+    def observe(self, value: float, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, *labels) -> int:
+        series = self.series.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def quantile(self, q: float, *labels) -> float:
+        """Upper bound of the bucket holding the q-th observation (good enough for log summaries)."""
+        series = self.series.get(labels)
+        if not series:
+            return 0.0
+        target = q * sum(series[:-1])
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def expose(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]:g}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Holds our own metrics plus stats() snapshots of the caches, limiter, processor etc."""
+
+    def __init__(self):
+        self.metrics = []
+        self.sources = {}
+
+    def counter(self, *args, **kwargs) -> Counter:
+        metric = Counter(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def add_stats(self, prefix: str, source, label: str = "key"):
+        """Exports source.stats() on every scrape; nested dicts become one series per key."""
+        self.sources[prefix] = (source, label)
+
+    def expose(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.expose())
+        for prefix, (source, label) in self.sources.items():
+            for key, value in source.stats().items():
+                name = f"{prefix}_{key}"
+                lines.append(f"# TYPE {name} untyped")
+                if isinstance(value, dict):
+                    for sub_key, sub_value in sorted(value.items()):
+                        lines.append(f'{name}{{{label}="{sub_key}"}} {float(sub_value):g}')
+                else:
+                    lines.append(f"{name} {float(value):g}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HANDLER_LATENCY = registry.histogram("bot_handler_seconds", "Time spent in each update handler", ("handler",))
+HANDLER_ERRORS = registry.counter("bot_handler_errors_total", "Exceptions escaping each update handler", ("handler",))
+API_LATENCY = registry.histogram("bot_api_seconds", "Bot API request latency by method", ("method",))
+API_ERRORS = registry.counter("bot_api_errors_total", "Failed Bot API requests by method", ("method",))
+SUBSCRIPTION_WAIT = registry.histogram(
+    "bot_subscription_check_seconds", "Time handlers wait on check_subscription", ("source",)
+)
+
+# ------------------- INSTRUMENTATION ----------------------
+
+def instrument_handler(callback, name: str = None):
+    """Wraps a handler callback to record its latency and escaping exceptions."""
+    name = name or callback.__name__
+
+    async def instrumented(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, name)
+
+    instrumented.__name__ = name
+    instrumented.__wrapped__ = callback
+    return instrumented
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that times every Bot API call by method."""
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        endpoint = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+        except Exception:
+            API_ERRORS.inc(endpoint)
+            raise
+        finally:
+            API_LATENCY.observe(time.perf_counter() - started, endpoint)
+        if code >= 400:
+            API_ERRORS.inc(endpoint)
+        return code, payload
+
+# ------------------- EXPORT ----------------------
+
+async def _serve_metrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.split()
+        if len(parts) >= 2 and parts[1] == b"/metrics":
+            body = registry.expose().encode()
+            status = b"200 OK"
+        else:
+            body = b"not found\n"
+            status = b"404 Not Found"
+        writer.write(
+            b"HTTP/1.1 " + status + b"\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            b"Content-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host: str, port: int) -> asyncio.AbstractServer:
+    """Serves registry.expose() at http://host:port/metrics."""
+    return await asyncio.start_server(_serve_metrics, host, port)
+
+
+def summary() -> str:
+    """One line per handler and API method: count, errors, p50/p99 upper bounds."""
+    lines = []
+    for title, histogram, errors in (("handler", HANDLER_LATENCY, HANDLER_ERRORS), ("api", API_LATENCY, API_ERRORS)):
+        for labels in sorted(histogram.series):
+            lines.append(
+                f"{title} {labels[0]}: n={histogram.count(*labels)} errors={errors.values.get(labels, 0):g} "
+                f"p50<={histogram.quantile(0.5, *labels)}s p99<={histogram.quantile(0.99, *labels)}s"
+            )
+    for labels in sorted(SUBSCRIPTION_WAIT.series):
+        lines.append(
+            f"subscription check via {labels[0]}: n={SUBSCRIPTION_WAIT.count(*labels)} "
+            f"p99<={SUBSCRIPTION_WAIT.quantile(0.99, *labels)}s"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,278 @@
+import asyncio
+import functools
+import logging
+import time
+from collections import Counter, deque
+
+from telegram import Update
+from telegram.ext import (
+    ApplicationHandlerStop, BaseUpdateProcessor, CallbackQueryHandler, ChatMemberHandler,
+    ChosenInlineResultHandler, CommandHandler, InlineQueryHandler, MessageHandler, TypeHandler
+)
+
+logger = logging.getLogger(__name__)
+
+# ------------------- CONCURRENT UPDATE PROCESSING ----------------------
+
+class OrderedUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates concurrently while keeping each user's updates in order.
+
+    Updates from different users/chats run in parallel up to max_concurrent_updates.
+    Updates for a user that already has one in progress are queued behind it and run
+    by the same task, so a busy user occupies a single slot. Once a user has
+    max_queue_depth updates waiting, further ones are dropped (flood_policy="drop")
+    or held back until the queue drains (flood_policy="defer").
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_queue_depth: int = 20, flood_policy: str = "drop"):
+        super().__init__(max_concurrent_updates)
+        if flood_policy not in ("drop", "defer"):
+            raise ValueError(f"Unknown flood policy: {flood_policy}")
+        self.max_queue_depth = max_queue_depth
+        self.flood_policy = flood_policy
+        self._queues = {}
+        # key -> deferred (received_at, coroutine, future) entries, oldest first. The task working
+        # on the key moves them into its queue as room frees up, so they keep their place in line.
+        self._deferred = {}
+
+        self.processed = 0
+        self.dropped = 0
+        self.deferred = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    @staticmethod
+    def ordering_key(update: object):
+        """Updates sharing a key are processed strictly in arrival order."""
+        if isinstance(update, Update):
+            if update.effective_user:
+                return ("user", update.effective_user.id)
+            if update.effective_chat:
+                return ("chat", update.effective_chat.id)
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        for queue in self._queues.values():
+            for _, coroutine in queue:
+                coroutine.close()
+            queue.clear()
+        for deferred in self._deferred.values():
+            for _, coroutine, future in deferred:
+                coroutine.close()
+                future.cancel()
+        self._deferred.clear()
+        self.queued = 0
+
+    def _enqueue(self, queue: deque, received_at: float, coroutine):
+        queue.append((received_at, coroutine))
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+
+    def _refill(self, key, queue: deque):
+        """Moves deferred updates for key into its queue while there is room, releasing their callers."""
+        deferred = self._deferred.get(key)
+        # With max_queue_depth 0 deferred updates still go through the queue one at a time
+        while deferred and len(queue) < max(self.max_queue_depth, 1):
+            received_at, coroutine, future = deferred.popleft()
+            self._enqueue(queue, received_at, coroutine)
+            future.set_result(None)
+        if deferred is not None and not deferred:
+            del self._deferred[key]
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        received_at = time.monotonic()
+        key = self.ordering_key(update)
+        if key is None:
+            await self._run(received_at, coroutine)
+            return
+
+        queue = self._queues.get(key)
+        if queue is not None:
+            # Anything already deferred for this key is ahead of us, even if the queue has room
+            if len(queue) < self.max_queue_depth and key not in self._deferred:
+                # Hand the update to the task already working on this key and free our slot
+                self._enqueue(queue, received_at, coroutine)
+                return
+            if self.flood_policy == "drop":
+                coroutine.close()
+                self.dropped += 1
+                logger.warning("Dropped update for %s %s: %s updates already queued", key[0], key[1], len(queue))
+                return
+            # Keep our slot until the update has moved into the queue
+            self.deferred += 1
+            entry = (received_at, coroutine, asyncio.get_running_loop().create_future())
+            self._deferred.setdefault(key, deque()).append(entry)
+            try:
+                await entry[2]
+            except asyncio.CancelledError:
+                deferred = self._deferred.get(key)
+                if deferred and entry in deferred:
+                    deferred.remove(entry)
+                    coroutine.close()
+                    if not deferred:
+                        del self._deferred[key]
+                raise
+            return
+
+        queue = self._queues[key] = deque()
+        try:
+            await self._run(received_at, coroutine)
+            self._refill(key, queue)
+            while queue:
+                received_at, coroutine = queue.popleft()
+                self.queued -= 1
+                self._refill(key, queue)
+                await self._run(received_at, coroutine)
+        finally:
+            del self._queues[key]
+            # Only left over if the task was cancelled; nothing would ever release these callers
+            for _, coroutine, future in self._deferred.pop(key, ()):
+                coroutine.close()
+                future.cancel()
+
+    async def _run(self, received_at: float, coroutine) -> None:
+        waited = time.monotonic() - received_at
+        self.wait_time_total += waited
+        self.wait_time_max = max(self.wait_time_max, waited)
+        self.processed += 1
+        try:
+            await coroutine
+        except Exception as e:
+            # Application.process_update reports handler errors itself; this only guards the queue
+            logger.error("Unhandled error while processing update: %s", e, exc_info=e)
+
+    def stats(self) -> dict:
+        return {
+            "active_keys": len(self._queues),
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "deferred": self.deferred,
+            "wait_time_avg": self.wait_time_total / self.processed if self.processed else 0.0,
+            "wait_time_max": self.wait_time_max,
+        }
+
+
+# ------------------- UPDATE TYPE FILTERING ----------------------
+
+# Update types each handler class consumes. All our message handlers read update.message,
+# so edited messages and channel posts are deliberately not requested.
+HANDLER_UPDATE_TYPES = {
+    CommandHandler: (Update.MESSAGE,),
+    MessageHandler: (Update.MESSAGE,),
+    CallbackQueryHandler: (Update.CALLBACK_QUERY,),
+    InlineQueryHandler: (Update.INLINE_QUERY,),
+    ChosenInlineResultHandler: (Update.CHOSEN_INLINE_RESULT,),
+}
+CHAT_MEMBER_UPDATE_TYPES = {
+    ChatMemberHandler.MY_CHAT_MEMBER: (Update.MY_CHAT_MEMBER,),
+    ChatMemberHandler.CHAT_MEMBER: (Update.CHAT_MEMBER,),
+    ChatMemberHandler.ANY_CHAT_MEMBER: (Update.MY_CHAT_MEMBER, Update.CHAT_MEMBER),
+}
+
+
+def required_update_types(application) -> list:
+    """Works out from the registered handlers which update types Telegram should send us.
+
+    TypeHandlers are middleware and do not widen the set. An unknown handler class
+    makes us fall back to every update type rather than silently miss updates.
+    """
+    required = set()
+    # Handler tables hold UpdateType members; compare by their string values
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, TypeHandler):
+                continue
+            if isinstance(handler, ChatMemberHandler):
+                required.update(t.value for t in CHAT_MEMBER_UPDATE_TYPES[handler.chat_member_types])
+                continue
+            for handler_class, update_types in HANDLER_UPDATE_TYPES.items():
+                if isinstance(handler, handler_class):
+                    required.update(t.value for t in update_types)
+                    break
+            else:
+                return list(UPDATE_TYPES)
+    return [name for name in UPDATE_TYPES if name in required]
+
+
+UPDATE_TYPES = [update_type.value for update_type in Update.ALL_TYPES]
+
+
+def update_type(update: Update) -> str:
+    """The name of the (single) payload field set on an update, e.g. "message"."""
+    for name in UPDATE_TYPES:
+        if getattr(update, name, None) is not None:
+            return name
+    return "unknown"
+
+
+def update_date(update: Update):
+    """When the user sent/did what the update is about, or None for undated updates.
+
+    Callback and inline queries carry no date of their own (a callback's message may be
+    old while the button press is not), so they are never considered stale.
+    """
+    message = update.message or update.edited_message or update.channel_post or update.edited_channel_post
+    if message:
+        return message.edit_date or message.date
+    event = update.chat_member or update.my_chat_member or update.chat_join_request or update.message_reaction
+    return event.date if event else None
+
+
+class UpdateTypeGate:
+    """First handler group: counts every update by type and stops the ones no handler wants.
+
+    Telegram already filters by allowed_updates; this catches the rest (e.g. updates
+    queued before allowed_updates changed) before any handler filter runs. With max_age
+    set, dated updates older than that many seconds (backlog from while the bot was
+    down) are stopped too. Updates let through count as admitted; they count as handled
+    once a callback wrapped with count_handled runs for them.
+    """
+
+    def __init__(self, allowed: list, max_age: float = 0):
+        self.allowed = frozenset(str(name) for name in allowed)
+        self.max_age = max_age
+        self.received = Counter()
+        self.admitted = Counter()
+        self.handled = Counter()
+        self.stale = Counter()
+
+    async def __call__(self, update: Update, context) -> None:
+        name = update_type(update)
+        self.received[name] += 1
+        if name not in self.allowed:
+            raise ApplicationHandlerStop
+        if self.max_age:
+            sent = update_date(update)
+            if sent and time.time() - sent.timestamp() > self.max_age:
+                self.stale[name] += 1
+                raise ApplicationHandlerStop
+        self.admitted[name] += 1
+
+    def count_handled(self, callback):
+        """Wraps a handler callback so every run counts its update as handled.
+
+        Only for handlers in the same group, so that an update counts at most once.
+        """
+        @functools.wraps(callback)
+        async def counting(update, context):
+            self.handled[update_type(update)] += 1
+            return await callback(update, context)
+        return counting
+
+    def handler(self) -> TypeHandler:
+        return TypeHandler(Update, self)
+
+    def stats(self) -> dict:
+        return {
+            "received": dict(self.received),
+            "admitted": dict(self.admitted),
+            "handled": dict(self.handled),
+            "stale": dict(self.stale),
+        }
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# ------------------- OUTBOUND RATE LIMITING ----------------------
+
+# Passed as rate_limit_args={"priority": ...}. Interactive replies go first; notices
+# (e.g. the force-sub message) only take global capacity nobody interactive is waiting for.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NOTICE = 1
+
+# Only these count against Telegram's message limits; lookups and getUpdates pass straight through
+LIMITED_PREFIXES = ("send", "edit", "copy", "forward")
+
+
+class TokenBucket:
+    """Classic token bucket: rate tokens per second, up to capacity banked."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def take(self, now: float = None) -> float:
+        """Takes a token and returns 0, or returns how long to wait before trying again."""
+        if now is None:
+            now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def block(self, seconds: float):
+        """Refuses every token for the next seconds, e.g. after a RetryAfter."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+def is_group_chat(chat_id) -> bool:
+    # Groups, supergroups and channels have negative ids or are addressed by @username
+    return (isinstance(chat_id, int) and chat_id < 0) or (isinstance(chat_id, str) and not chat_id.lstrip("-").isdigit())
+
+
+class FloodLimiter(BaseRateLimiter[dict]):
+    """Keeps outbound messages within Telegram's flood limits.
+
+    Every message waits for a global bucket (overall_rate per second) and a per-chat
+    bucket (per_chat_rate per second, plus group_per_minute in groups). A RetryAfter
+    from Telegram blocks the affected chat (or everything, for calls without a chat)
+    for the server-provided delay and the request is retried up to max_retries times.
+    """
+
+    def __init__(self, overall_rate=30.0, per_chat_rate=1.0, per_chat_burst=3, group_per_minute=20,
+                 max_retries=3, max_chats=10000):
+        self.overall_rate = overall_rate
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.group_per_minute = group_per_minute
+        self.max_retries = max_retries
+        self._global = TokenBucket(overall_rate, overall_rate)
+        # An idle bucket refills completely within a minute, so evicting it loses nothing
+        self._chats = TTLCache(maxsize=max_chats, ttl=60)
+        self._interactive_waiting = 0
+
+        self.sent = 0
+        self.throttled = 0
+        self.throttle_time = 0.0
+        self.retries = 0
+        self.failed = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _chat_buckets(self, chat_id) -> tuple:
+        buckets = self._chats.get(chat_id, count=False)
+        if buckets is None:
+            buckets = (TokenBucket(self.per_chat_rate, self.per_chat_burst),)
+            if is_group_chat(chat_id):
+                buckets = (TokenBucket(self.per_chat_rate, 1), TokenBucket(self.group_per_minute / 60, self.group_per_minute))
+        self._chats.set(chat_id, buckets)
+        return buckets
+
+    async def _wait(self, bucket: TokenBucket, priority: int) -> float:
+        waited = 0.0
+        while True:
+            if priority != PRIORITY_INTERACTIVE and self._interactive_waiting and bucket is self._global:
+                delay = 1 / self.overall_rate
+            else:
+                delay = bucket.take()
+                if not delay:
+                    return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+    async def _acquire(self, chat_id, priority: int):
+        waited = 0.0
+        if chat_id is not None:
+            for bucket in self._chat_buckets(chat_id):
+                waited += await self._wait(bucket, priority)
+
+        if priority == PRIORITY_INTERACTIVE:
+            self._interactive_waiting += 1
+        try:
+            waited += await self._wait(self._global, priority)
+        finally:
+            if priority == PRIORITY_INTERACTIVE:
+                self._interactive_waiting -= 1
+
+        if waited:
+            self.throttled += 1
+            self.throttle_time += waited
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if not endpoint.startswith(LIMITED_PREFIXES):
+            return await callback(*args, **kwargs)
+
+        chat_id = data.get("chat_id")
+        priority = (rate_limit_args or {}).get("priority", PRIORITY_INTERACTIVE)
+
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id, priority)
+            try:
+                result = await callback(*args, **kwargs)
+                self.sent += 1
+                return result
+            except RetryAfter as e:
+                delay = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    raise
+                self.retries += 1
+                logger.warning("Flood limit hit on %s for chat %s; retrying in %ss", endpoint, chat_id, delay)
+                if chat_id is not None:
+                    for bucket in self._chat_buckets(chat_id):
+                        bucket.block(delay)
+                else:
+                    self._global.block(delay)
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "throttled": self.throttled,
+            "throttle_time": self.throttle_time,
+            "retries": self.retries,
+            "failed": self.failed,
+            "tracked_chats": len(self._chats),
+        }
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import logging
+import signal
+from multiprocessing.managers import BaseManager, MakeProxyType
+from queue import Full
+
+from telegram import Update
+
+from cache import SharedMapping
+from processing import OrderedUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# ------------------- SHARDED PROCESSING ----------------------
+# The front process receives updates (polling or webhook) and forwards each one as JSON
+# to the worker that owns its user, so a user's updates always land on the same worker
+# and that worker's OrderedUpdateProcessor keeps them in order.
+
+STOP = object()
+
+
+def ignore_stop_signals():
+    """For worker and manager processes: only the front process reacts to Ctrl+C/SIGTERM."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+class CacheManager(BaseManager):
+    """Manager process holding the SharedMappings behind the workers' SharedTTLCaches."""
+
+
+class SharedMappingProxy(MakeProxyType("SharedMapping", ("__len__", "__setitem__", "clear", "get", "pop", "prune"))):
+    """What workers hold instead of the SharedMapping; prune runs in the manager process."""
+
+
+CacheManager.register("SharedMapping", SharedMapping, SharedMappingProxy)
+
+
+def shard_for(update: Update, shards: int) -> int:
+    """Worker index for an update: by user, then chat, like the per-user ordering key.
+
+    Member updates go by the member rather than whoever added/removed them, so the
+    member's own worker sees its membership change.
+    """
+    if update.chat_member:
+        return update.chat_member.new_chat_member.user.id % shards
+    key = OrderedUpdateProcessor.ordering_key(update)
+    if key is None:
+        return 0
+    return key[1] % shards
+
+
+class ShardRouter:
+    """Moves updates from the front process's update queue to the worker queues."""
+
+    def __init__(self, queues: list):
+        self.queues = queues
+        self.routed = [0] * len(queues)
+        self.blocked = 0
+        self.stopped = False
+
+    async def run(self, update_queue: asyncio.Queue):
+        """Routes until STOP is put on update_queue, then tells every worker to finish."""
+        loop = asyncio.get_running_loop()
+        while True:
+            update = await update_queue.get()
+            if update is STOP:
+                break
+            shard = shard_for(update, len(self.queues))
+            payload = update.to_json()
+            try:
+                self.queues[shard].put_nowait(payload)
+            except Full:
+                # Waiting here (rather than skipping ahead) keeps every user's updates in order
+                self.blocked += 1
+                await loop.run_in_executor(None, self.queues[shard].put, payload)
+            self.routed[shard] += 1
+        for queue in self.queues:
+            await loop.run_in_executor(None, queue.put, None)
+        self.stopped = True
+
+    def stats(self) -> dict:
+        return {"routed": {str(shard): count for shard, count in enumerate(self.routed)}, "blocked": self.blocked}
+
+
+async def feed_worker(application, queue):
+    """Worker side: hands updates from the front process to the application until told to stop."""
+    loop = asyncio.get_running_loop()
+    while True:
+        payload = await loop.run_in_executor(None, queue.get)
+        if payload is None:
+            return
+        await application.update_queue.put(Update.de_json(json.loads(payload), application.bot))
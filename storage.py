@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# ------------------- PERSISTENT STORE ----------------------
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscriptions (
+    user_id INTEGER PRIMARY KEY,
+    is_member INTEGER NOT NULL,
+    checked_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id INTEGER PRIMARY KEY,
+    type TEXT NOT NULL,
+    title TEXT,
+    username TEXT,
+    first_name TEXT,
+    last_name TEXT,
+    seen_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class Store:
+    """SQLite store for subscription results, chat metadata, usage counters and small settings.
+
+    The record_* methods only buffer in memory and never touch the disk. Buffered
+    writes are coalesced per key and flushed in one transaction every flush_interval
+    seconds on a dedicated thread, so the event loop never waits on SQLite. Usage
+    counter totals (stored plus not yet flushed) are loaded on open and kept in memory
+    for stats().
+    """
+
+    def __init__(self, path: str, flush_interval: float = 5.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store")
+        self._db = None
+        self._flusher = None
+        self._subscriptions = {}
+        self._chats = {}
+        self._counters = Counter()
+        self._totals = Counter()
+        self._values = {}
+
+        self.flushes = 0
+        self.rows_written = 0
+
+    async def _run(self, func, *args):
+        # Every database call runs on the single store thread
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _open(self):
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    async def open(self):
+        await self._run(self._open)
+        self._totals.update(await self.load_counters())
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._flusher:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+        if self._db:
+            await self._run(self._db.close)
+            self._db = None
+        self._executor.shutdown(wait=True)
+
+    # --- buffered writes ---
+
+    def record_subscription(self, user_id: int, is_member: bool):
+        self._subscriptions[user_id] = (int(is_member), time.time())
+
+    def record_chat(self, info):
+        self._chats[info.id] = (str(info.type), info.title, info.username, info.first_name, info.last_name, time.time())
+
+    def increment(self, name: str, amount: int = 1):
+        self._counters[name] += amount
+        self._totals[name] += amount
+
+    def set_value(self, key: str, value):
+        self._values[key] = value
+
+    @property
+    def pending(self) -> int:
+        return len(self._subscriptions) + len(self._chats) + len(self._counters) + len(self._values)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Store flush failed: %s", e, exc_info=e)
+
+    async def flush(self):
+        """Writes everything buffered so far in a single transaction."""
+        if not self.pending or self._db is None:
+            return
+        batch = (self._subscriptions, self._chats, self._counters, self._values)
+        self._subscriptions, self._chats, self._counters, self._values = {}, {}, Counter(), {}
+        await self._run(self._write, *batch)
+
+    def _write(self, subscriptions, chats, counters, values):
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO subscriptions VALUES (?, ?, ?)",
+                [(user_id, *row) for user_id, row in subscriptions.items()]
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO chats VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(chat_id, *row) for chat_id, row in chats.items()]
+            )
+            self._db.executemany(
+                "INSERT INTO counters VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                list(counters.items())
+            )
+            self._db.executemany("INSERT OR REPLACE INTO kv VALUES (?, ?)", list(values.items()))
+        self.flushes += 1
+        self.rows_written += len(subscriptions) + len(chats) + len(counters) + len(values)
+
+    # --- startup reads ---
+
+    def _query(self, sql, params=()):
+        return self._db.execute(sql, params).fetchall()
+
+    async def load_subscriptions(self, max_age: float, limit: int) -> list:
+        """(user_id, is_member, checked_at) rows checked within max_age seconds, newest first."""
+        return await self._run(
+            self._query,
+            "SELECT user_id, is_member, checked_at FROM subscriptions WHERE checked_at > ? ORDER BY checked_at DESC LIMIT ?",
+            (time.time() - max_age, limit)
+        )
+
+    async def load_chats(self, max_age: float, limit: int) -> list:
+        """(chat_id, type, title, username, first_name, last_name, seen_at) rows, newest first."""
+        return await self._run(
+            self._query,
+            "SELECT * FROM chats WHERE seen_at > ? ORDER BY seen_at DESC LIMIT ?",
+            (time.time() - max_age, limit)
+        )
+
+    async def load_counters(self) -> dict:
+        return dict(await self._run(self._query, "SELECT name, value FROM counters"))
+
+    async def get_value(self, key: str):
+        if key in self._values:
+            return self._values[key]
+        rows = await self._run(self._query, "SELECT value FROM kv WHERE key = ?", (key,))
+        return rows[0][0] if rows else None
+
+    def stats(self) -> dict:
+        return {"pending": self.pending, "flushes": self.flushes, "rows_written": self.rows_written, "usage": dict(self._totals)}
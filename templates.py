@@ -0,0 +1,241 @@
+from html import escape
+from operator import itemgetter
+from string import Formatter
+
+# ------------------- RESPONSE TEMPLATES ----------------------
+# Every reply layout is compiled once at import. Static parts (branding, footers) are
+# baked in here; rendering only substitutes the per-message fields, HTML-escaped.
+
+DEVELOPER = "@Zeroboy216"
+UPDATE_CHANNEL = "https://t.me/zerodevbro"
+SUPPORT_GROUP = "https://t.me/zerodevsupport1"
+
+
+class Html(str):
+    """A field value that is already safe HTML and must not be escaped again."""
+
+
+class Template:
+    """A reply layout with {field} placeholders, precompiled to a %-format string."""
+
+    __slots__ = ("_format", "_fields", "_values")
+
+    def __init__(self, text: str, **static):
+        chunks = []
+        fields = []
+        for literal, field, _, _ in Formatter().parse(text):
+            chunks.append(literal.replace("%", "%%"))
+            if field is None:
+                continue
+            if field in static:
+                chunks.append(str(static[field]).replace("%", "%%"))
+            else:
+                chunks.append("%s")
+                fields.append(field)
+        self._format = "".join(chunks)
+        self._fields = tuple(fields)
+        if len(fields) == 1:
+            field = fields[0]
+            self._values = lambda values: (values[field],)
+        else:
+            self._values = itemgetter(*fields) if fields else lambda values: ()
+
+    @property
+    def fields(self) -> tuple:
+        return self._fields
+
+    def render(self, **values) -> str:
+        # Numbers (ids) cannot carry markup, so only text goes through escape()
+        return self._format % tuple([
+            value if type(value) is int or type(value) is Html else escape(str(value), quote=False)
+            for value in self._values(values)
+        ])
+
+
+BRANDING = dict(developer=DEVELOPER, update_channel=UPDATE_CHANNEL, support_group=SUPPORT_GROUP)
+
+FOOTER = "\n<b>Developer:</b> {developer}\n"
+SHARED_BY = "\n<i>Shared by: {sharer_name} (<code>{sharer_id}</code>)</i>\n"
+FORWARDED_BY = "\n<i>Forwarded by: {sharer_name}</i>\n"
+
+# Common "who is this" block reused by every user layout
+USER_FIELDS = """
+<b>First Name:</b> {first_name}
+<b>Last Name:</b> {last_name}
+<b>Username:</b> @{username}"""
+BOT_PREMIUM_FIELDS = """
+<b>Is Bot:</b> {is_bot}
+<b>Is Premium:</b> {is_premium}"""
+
+# Chat blocks share the same fields for shared and forwarded chats
+CHAT_FIELDS = """
+<b>Chat ID:</b> <code>{chat_id}</code>
+<b>Title:</b> {title}
+<b>Username:</b> @{username}
+<b>Type:</b> {type_name}"""
+
+FORCE_SUB = Template("""
+<b>🛑 Access Denied!</b>
+
+You must join our Update Channel {channel} to use this bot.
+Please click the button below and then click <b>Try Again</b>.
+""" + FOOTER, **BRANDING)
+
+WELCOME = Template("""
+<b>Hi Welcome To @{bot_username} 👋</b>
+
+Using this bot, you can get the numerical ID of users.
+
+<b>Developer:</b> {developer}
+
+📚 <b>Help:</b> /help
+
+🔔 <b>Update Channel:</b> <a href="{update_channel}">Click Here</a>
+👥 <b>Support Group:</b> <a href="{support_group}">Click Here</a>
+
+<b>Your ID:</b> <code>{user_id}</code>
+
+<i>You can check any <b>User | Chat | IDBot</b> just forward or share any chat with me!</i>
+""", **BRANDING)
+
+# Fully static: rendered once here and sent as-is
+HELP = Template("""
+<b>🔍 How to use this bot:</b>
+
+<b>1️⃣ Get User ID:</b>
+• Click "👤 User" button and select any user
+• Click "⭐ Premium" button to select premium users
+• Click "🤖 Bot" button to select bots
+
+<b>2️⃣ Get Chat ID:</b>
+• Click "👥 Group" button and select any group
+• Click "📢 Channel" button and select any channel
+• Click "💬 Forum" button and select any forum
+
+<b>3️⃣ Get Your Chats:</b>
+• Click "👥 My Group" for groups where you're admin
+• Click "📢 My Channel" for channels where you're admin
+• Click "💬 My Forum" for forums where you're admin
+
+<b>4️⃣ Commands:</b>
+/start - Start bot & show main menu
+/help - Show this help
+/id - Get your ID
+
+<b>💡 Tips:</b>
+✅ Use the keyboard buttons to select chats
+✅ You can also forward messages to get IDs
+✅ Share contacts to get user IDs
+
+<b>Developer:</b> {developer}
+<b>Update Channel:</b> {update_channel}
+<b>Support Group:</b> {support_group}
+""", **BRANDING).render()
+
+REPLIED_USER = Template("""
+<b>👤 User Information:</b>
+
+<b>User ID:</b> <code>{user_id}</code>""" + USER_FIELDS + BOT_PREMIUM_FIELDS + """
+
+<i>Reply sent by:</i> {sharer_name} (<code>{sharer_id}</code>)
+""")
+
+OWN_USER = Template("""
+<b>👤 Your Information:</b>
+
+<b>Your ID:</b> <code>{user_id}</code>""" + USER_FIELDS + BOT_PREMIUM_FIELDS + """
+<b>Language:</b> {language}
+
+<i>💡 Tip: Use the keyboard buttons to select users and chats!</i>
+""" + FOOTER, **BRANDING)
+
+SHARED_USER = Template("""
+<b>👤 User Information:</b>
+
+<b>User ID:</b> <code>{user_id}</code>""" + USER_FIELDS + """
+<b>Type:</b> {type}
+""" + SHARED_BY + FOOTER, **BRANDING)
+
+SHARED_USER_ID = Template("""
+<b>👤 User Information:</b>
+
+<b>User ID:</b> <code>{user_id}</code>
+""" + SHARED_BY + FOOTER, **BRANDING)
+
+SHARED_USERS_ROW = Template("• <code>{user_id}</code>")
+SHARED_USERS_ROW_NAMED = Template("• <code>{user_id}</code> — {name}")
+SHARED_USERS = Template("""
+<b>👥 Multiple Users Shared:</b>
+
+{user_list}
+""" + SHARED_BY + FOOTER, **BRANDING)
+
+SHARED_CHAT = Template("""
+<b>{emoji} {type_name} Information:</b>
+""" + CHAT_FIELDS + "\n" + SHARED_BY + FOOTER, **BRANDING)
+
+SHARED_CHAT_ID = Template("""
+<b>💬 Chat Information:</b>
+
+<b>Chat ID:</b> <code>{chat_id}</code>
+""" + SHARED_BY + FOOTER, **BRANDING)
+
+FORWARDED_USER = Template("""
+<b>✉️ Forwarded Message Info (User):</b>
+
+<b>Sender ID:</b> <code>{user_id}</code>""" + USER_FIELDS + BOT_PREMIUM_FIELDS + "\n" + FORWARDED_BY + FOOTER, **BRANDING)
+
+FORWARDED_CHAT = Template("""
+<b>{emoji} {type_name} Information (Forwarded):</b>
+""" + CHAT_FIELDS + "\n" + FORWARDED_BY + FOOTER, **BRANDING)
+
+FORWARDED_HIDDEN = Template("""
+<b>🔒 Privacy Protected User</b>
+
+<b>Name:</b> {name}
+<b>User ID:</b> <i>Hidden (User has privacy settings enabled)</i>
+
+<i>This user has enabled forward privacy settings, so their ID cannot be retrieved.</i>
+""" + FORWARDED_BY + FOOTER, **BRANDING)
+
+CONTACT = Template("""
+<b>📇 Contact Information:</b>
+
+<b>User ID:</b> <code>{user_id}</code>
+<b>First Name:</b> {first_name}
+<b>Last Name:</b> {last_name}
+<b>Phone:</b> {phone}
+""" + SHARED_BY + FOOTER, **BRANDING)
+
+PRIVATE_GREETING = Template("""
+<b>👋 Hi {first_name}!</b>
+
+<b>Your ID:</b> <code>{user_id}</code>
+
+<i>💡 Use the keyboard buttons below to select users or chats!</i>
+
+Use /start to see the welcome message.
+""" + FOOTER, **BRANDING)
+
+GROUP_CHAT = Template("""
+<b>📊 Chat Information:</b>
+
+<b>Chat ID:</b> <code>{chat_id}</code>
+<b>Chat Title:</b> {title}
+<b>Chat Type:</b> {type}
+<b>Your ID:</b> <code>{user_id}</code>
+""" + FOOTER, **BRANDING)
+
+SUB_CONFIRMED_CAPTION = "✅ <b>Subscription Confirmed!</b> You now have full access. Select an option below."
+SUB_FAILED_CAPTION = "❌ <b>Subscription Failed.</b> Please ensure you have joined the channel and try again."
+
+# Bulk lookups: one row per reference, paginated over several messages
+BULK_PAGE = Template("""
+<b>🔎 Bulk Lookup</b> ({done}/{total} done) — page {page}/{pages}
+
+{rows}
+""")
+BULK_ROW = Template("{reference} → <code>{chat_id}</code> {emoji} {type_name} — {title}")
+BULK_ROW_PENDING = Template("{reference} → ⏳")
+BULK_ROW_FAILED = Template("{reference} → ❌ {error}")
+BULK_TRUNCATED = Template("<i>Only the first {limit} of {total} usernames/links were looked up.</i>")
@@ -0,0 +1,137 @@
+"""Handler paths in bot.py, driven with stand-ins for the Update and the Bot.
+
+    python -m unittest test_bot
+"""
+import asyncio
+import os
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+# bot.py reads its configuration at import time
+os.environ.setdefault("BOT_TOKEN", "123:test")
+os.environ.setdefault("STORE_PATH", ":memory:")
+os.environ.setdefault("METRICS_PORT", "0")
+os.environ.setdefault("LOG_FORMAT", "text")
+
+from telegram.error import BadRequest
+
+import bot
+
+CHAT_ID = 10_000
+
+
+class RecordingBot:
+    """Has the call signature of Bot.send_message and remembers what was sent."""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        self.sent.append((chat_id, text, reply_markup))
+
+
+def callback_update(data: str, edit_fails: bool = False):
+    query = SimpleNamespace(
+        data=data,
+        from_user=SimpleNamespace(id=CHAT_ID),
+        message=SimpleNamespace(chat_id=CHAT_ID, reply_markup=None),
+        answer=mock.AsyncMock(),
+        edit_message_caption=mock.AsyncMock(side_effect=RuntimeError("message is not modified") if edit_fails else None),
+    )
+    return SimpleNamespace(callback_query=query)
+
+
+class CheckSubCallbackTest(unittest.IsolatedAsyncioTestCase):
+    """The "Try Again" button once the user has joined the channel."""
+
+    async def asyncSetUp(self):
+        self.bot = RecordingBot()
+        self.context = SimpleNamespace(bot=self.bot)
+        bot.keyboards.mark_removed(CHAT_ID)
+        patcher = mock.patch.object(bot, "check_subscription", mock.AsyncMock(return_value=True))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_confirmed_gets_welcome_and_keyboard(self):
+        await bot.handle_callback_query(callback_update("check_sub"), self.context)
+        self.assertEqual(len(self.bot.sent), 1)
+        chat_id, text, reply_markup = self.bot.sent[0]
+        self.assertEqual(chat_id, CHAT_ID)
+        self.assertIn("Welcome back", text)
+        self.assertIs(reply_markup, bot.main_keyboard())
+        # Sent, so the next reply does not attach it again
+        self.assertIsNone(bot.reply_keyboard(CHAT_ID))
+
+    async def test_confirmed_when_caption_edit_fails(self):
+        await bot.handle_callback_query(callback_update("check_sub", edit_fails=True), self.context)
+        self.assertEqual(len(self.bot.sent), 1)
+        chat_id, text, reply_markup = self.bot.sent[0]
+        self.assertIn("Subscription Confirmed", text)
+        self.assertIs(reply_markup, bot.main_keyboard())
+
+
+class PageMessage:
+    """A sent page whose edits fail as listed in failures (None for success)."""
+
+    def __init__(self, text, failures=()):
+        self.text = text
+        self.failures = list(failures)
+
+    async def edit_text(self, text, **kwargs):
+        if self.failures and self.failures.pop(0):
+            raise BadRequest("message to edit not found")
+        self.text = text
+
+
+class BulkResolveTest(unittest.IsolatedAsyncioTestCase):
+    """Streaming results of a bulk lookup into its page message."""
+
+    async def asyncSetUp(self):
+        self.hang = asyncio.Event()
+        self.started = asyncio.Event()
+
+        async def resolve_reference(context, reference):
+            if reference == "@boom":
+                raise RuntimeError("boom")
+            if reference == "@hang":
+                self.started.set()
+                try:
+                    await self.hang.wait()
+                finally:
+                    self.hang.cancelled = True
+            return "not found"
+
+        self.page = None
+
+        async def reply_html(text):
+            self.page = PageMessage(text, failures=[True])
+            return self.page
+
+        self.message = SimpleNamespace(reply_html=reply_html)
+        for name, value in (("resolve_reference", resolve_reference), ("BULK_EDIT_INTERVAL", 0.01)):
+            patcher = mock.patch.object(bot, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_failed_lookups_and_edits_still_finish_every_row(self):
+        with self.assertLogs("bot", "WARNING") as logs:
+            await bot.bulk_resolve(self.message, None, ["@ok", "@boom"])
+        self.assertIn("@ok → ❌ not found", self.page.text)
+        self.assertIn("@boom → ❌ lookup failed", self.page.text)
+        self.assertNotIn("⏳", self.page.text)
+        self.assertTrue(any("Could not update bulk lookup page" in line for line in logs.output))
+
+    async def test_cancelling_cancels_lookups(self):
+        self.hang.cancelled = False
+        task = asyncio.create_task(bot.bulk_resolve(self.message, None, ["@hang"]))
+        await self.started.wait()
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+        self.assertTrue(self.hang.cancelled)
+
+
+if __name__ == "__main__":
+    unittest.main()
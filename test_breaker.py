@@ -0,0 +1,90 @@
+"""State transitions of CircuitBreaker.
+
+    python -m unittest test_breaker
+"""
+import asyncio
+import unittest
+
+from breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+RESET_TIMEOUT = 0.05
+
+
+class Upstream:
+    """Answers or fails as told, counting the calls that reach it."""
+
+    def __init__(self):
+        self.calls = 0
+        self.failing = False
+
+    async def __call__(self):
+        self.calls += 1
+        if self.failing:
+            raise ConnectionError("upstream down")
+        return "ok"
+
+
+class CircuitBreakerTest(unittest.IsolatedAsyncioTestCase):
+    """A breaker that opens after three connection errors and probes again after RESET_TIMEOUT."""
+
+    async def asyncSetUp(self):
+        self.upstream = Upstream()
+        self.breaker = CircuitBreaker(
+            "test", failure_threshold=3, reset_timeout=RESET_TIMEOUT,
+            is_failure=lambda e: isinstance(e, ConnectionError),
+        )
+
+    async def fail(self, times: int):
+        self.upstream.failing = True
+        for _ in range(times):
+            with self.assertRaises(ConnectionError):
+                await self.breaker.call(self.upstream)
+
+    async def test_closed_open_half_open_closed(self):
+        with self.assertLogs("breaker", "WARNING"):
+            await self.fail(2)
+            self.assertEqual(self.breaker.state, CLOSED)
+            await self.fail(1)
+            self.assertEqual(self.breaker.state, OPEN)
+
+            # Open: refused without reaching upstream
+            with self.assertRaises(CircuitOpenError):
+                await self.breaker.call(self.upstream)
+            self.assertEqual((self.upstream.calls, self.breaker.short_circuited), (3, 1))
+
+            await asyncio.sleep(RESET_TIMEOUT)
+            self.upstream.failing = False
+            self.assertTrue(self.breaker.allow())
+            self.assertEqual(self.breaker.state, HALF_OPEN)
+            # Only one probe at a time
+            self.assertFalse(self.breaker.allow())
+            self.breaker.record_success()
+            self.assertEqual(self.breaker.state, CLOSED)
+
+        self.assertEqual(await self.breaker.call(self.upstream), "ok")
+        self.assertEqual(
+            self.breaker.stats()["transitions"],
+            {"closed_to_open": 1, "open_to_half_open": 1, "half_open_to_closed": 1},
+        )
+
+    async def test_failed_probe_reopens(self):
+        with self.assertLogs("breaker", "WARNING"):
+            await self.fail(3)
+            await asyncio.sleep(RESET_TIMEOUT)
+            await self.fail(1)
+        self.assertEqual(self.breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            await self.breaker.call(self.upstream)
+
+    async def test_other_errors_do_not_open(self):
+        async def bad_request():
+            raise ValueError("bad request")
+
+        for _ in range(5):
+            with self.assertRaises(ValueError):
+                await self.breaker.call(bad_request)
+        self.assertEqual((self.breaker.state, self.breaker.failures), (CLOSED, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
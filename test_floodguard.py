@@ -0,0 +1,64 @@
+"""Bans and the global cap of FloodGuard, on a fake clock.
+
+    python -m unittest test_floodguard
+"""
+import time
+import unittest
+
+from floodguard import FloodGuard
+
+USER_ID = 10_000
+
+
+class FloodGuardTest(unittest.TestCase):
+    """Drives admit() with explicit times instead of waiting for real ones."""
+
+    def setUp(self):
+        # Buckets start from the real monotonic clock, so the fake one must not run behind it
+        self.now = time.monotonic()
+        self.guard = FloodGuard(limit=3, window=10, ban=60, max_ban=200, idle_after=600)
+
+    def admit(self, user_id=USER_ID, after: float = 0.0) -> str:
+        self.now += after
+        return self.guard.admit(user_id, self.now)
+
+    def flood(self, user_id=USER_ID) -> list:
+        """One update over the limit, a second apart."""
+        return [self.admit(user_id, after=1) for _ in range(self.guard.limit + 1)]
+
+    def test_bans_escalate_up_to_max_ban(self):
+        with self.assertLogs("floodguard", "WARNING"):
+            for duration in (60, 120, 200, 200):
+                self.assertEqual(self.flood(), ["ok", "ok", "ok", "rate_limited"])
+                self.assertEqual(self.admit(after=duration - 1), "banned")
+                # Once the ban is over, the window (well in the past by now) lets updates in again
+                self.now += 1
+        self.assertEqual(self.guard.bans, 4)
+
+    def test_strikes_are_forgotten_after_idle(self):
+        with self.assertLogs("floodguard", "WARNING") as logs:
+            self.flood()
+            self.now += 600
+            self.assertEqual(self.flood(), ["ok", "ok", "ok", "rate_limited"])
+        self.assertEqual(self.guard.evicted, 1)
+        self.assertIn("ignored for 60s", logs.output[-1])
+
+    def test_other_users_are_not_affected(self):
+        with self.assertLogs("floodguard", "WARNING"):
+            self.flood()
+        self.assertEqual(self.admit(USER_ID + 1), "ok")
+        self.assertEqual(self.admit(), "banned")
+
+    def test_global_cap(self):
+        self.guard = FloodGuard(limit=3, window=10, global_rate=5)
+        self.now = time.monotonic()
+        verdicts = [self.admit(USER_ID + i) for i in range(6)]
+        self.assertEqual(verdicts, ["ok"] * 5 + ["over_capacity"])
+        # One more token every 1/global_rate seconds
+        self.assertEqual(self.admit(USER_ID + 6, after=0.1), "over_capacity")
+        self.assertEqual(self.admit(USER_ID + 6, after=0.1), "ok")
+        self.assertEqual(self.admit(USER_ID + 7), "over_capacity")
+
+
+if __name__ == "__main__":
+    unittest.main()
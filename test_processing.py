@@ -0,0 +1,80 @@
+"""Per-key ordering of OrderedUpdateProcessor.
+
+    python -m unittest test_processing
+"""
+import asyncio
+import random
+import unittest
+
+from telegram import Update
+
+import fake_telegram
+from processing import OrderedUpdateProcessor
+
+USER_ID = 10_000
+
+
+class PerKeyOrderingTest(unittest.IsolatedAsyncioTestCase):
+    """A burst of updates from one user, each handler taking a random short time."""
+
+    async def replay(self, flood_policy: str, seed: int, count: int = 30, depth: int = 2) -> tuple:
+        rng = random.Random(seed)
+        processor = OrderedUpdateProcessor(8, depth, flood_policy)
+        await processor.initialize()
+        handled = []
+
+        async def handle(update_id: int):
+            await asyncio.sleep(rng.uniform(0, 0.002))
+            handled.append(update_id)
+
+        async def arrive(update_id: int):
+            update = Update.de_json(fake_telegram.make_message_update(update_id, USER_ID, "hello"), None)
+            await processor.process_update(update, handle(update_id))
+
+        tasks = []
+        for update_id in range(1, count + 1):
+            tasks.append(asyncio.create_task(arrive(update_id)))
+            if rng.random() < 0.5:
+                await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        await processor.shutdown()
+        return handled, processor
+
+    async def test_defer_keeps_order_and_every_update(self):
+        for seed in range(50):
+            handled, processor = await self.replay("defer", seed)
+            self.assertEqual(handled, list(range(1, 31)), f"seed {seed}")
+            self.assertEqual(processor.dropped, 0)
+            self.assertFalse(processor._deferred)
+
+    async def test_drop_keeps_order_of_the_rest(self):
+        for seed in range(50):
+            with self.assertLogs("processing", "WARNING"):
+                handled, processor = await self.replay("drop", seed)
+            self.assertEqual(handled, sorted(handled), f"seed {seed}")
+            self.assertEqual(len(handled) + processor.dropped, 30)
+
+    async def test_defer_with_no_queue(self):
+        handled, _ = await self.replay("defer", 1, depth=0)
+        self.assertEqual(handled, list(range(1, 31)))
+
+    async def test_shutdown_releases_deferred_callers(self):
+        processor = OrderedUpdateProcessor(8, 1, "defer")
+        await processor.initialize()
+        blocker = asyncio.Event()
+
+        async def handle():
+            await blocker.wait()
+
+        update = Update.de_json(fake_telegram.make_message_update(1, USER_ID, "hello"), None)
+        tasks = [asyncio.create_task(processor.process_update(update, handle())) for _ in range(4)]
+        await asyncio.sleep(0.01)
+        self.assertEqual(processor.deferred, 2)
+        await processor.shutdown()
+        blocker.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        self.assertEqual(sum(isinstance(result, asyncio.CancelledError) for result in results), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
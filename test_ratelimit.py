@@ -0,0 +1,81 @@
+"""Retries and priorities of FloodLimiter.
+
+    python -m unittest test_ratelimit
+"""
+import asyncio
+import time
+import unittest
+from datetime import timedelta
+
+from telegram.error import RetryAfter
+
+from ratelimit import PRIORITY_INTERACTIVE, PRIORITY_NOTICE, FloodLimiter
+
+CHAT_ID = 10_000
+RETRY_AFTER = 0.2
+
+
+class FloodLimiterTest(unittest.IsolatedAsyncioTestCase):
+    """Sends through process_request with a callback standing in for the Bot API call."""
+
+    async def asyncSetUp(self):
+        self.limiter = FloodLimiter(overall_rate=20, max_retries=2)
+        await self.limiter.initialize()
+
+    def send(self, callback, chat_id=CHAT_ID, priority=PRIORITY_INTERACTIVE):
+        return self.limiter.process_request(
+            callback, (), {}, "sendMessage", {"chat_id": chat_id}, {"priority": priority}
+        )
+
+    async def test_retry_after_blocks_the_chat_and_retries(self):
+        calls = []
+
+        async def callback():
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise RetryAfter(timedelta(seconds=RETRY_AFTER))
+            return "sent"
+
+        with self.assertLogs("ratelimit", "WARNING"):
+            self.assertEqual(await self.send(callback), "sent")
+        self.assertEqual(len(calls), 2)
+        self.assertGreaterEqual(calls[1] - calls[0], RETRY_AFTER)
+        self.assertEqual((self.limiter.retries, self.limiter.sent, self.limiter.failed), (1, 1, 0))
+
+        # Other chats are not held up by the block
+        started = time.monotonic()
+        await self.send(callback, chat_id=CHAT_ID + 1)
+        self.assertLess(time.monotonic() - started, RETRY_AFTER)
+
+    async def test_gives_up_after_max_retries(self):
+        async def callback():
+            raise RetryAfter(timedelta(seconds=0.01))
+
+        with self.assertLogs("ratelimit", "WARNING") as logs, self.assertRaises(RetryAfter):
+            await self.send(callback)
+        self.assertEqual(len(logs.output), 2)
+        self.assertEqual((self.limiter.retries, self.limiter.failed), (2, 1))
+
+    async def test_interactive_sends_go_ahead_of_notices(self):
+        # No global capacity left, so everything below queues for it
+        self.limiter._global.tokens = 0
+        order = []
+
+        def callback(name):
+            async def call():
+                order.append(name)
+            return call
+
+        tasks = [
+            asyncio.create_task(self.send(callback(f"notice {i}"), CHAT_ID + i, PRIORITY_NOTICE)) for i in range(3)
+        ]
+        await asyncio.sleep(0)
+        tasks += [
+            asyncio.create_task(self.send(callback(f"reply {i}"), CHAT_ID + 10 + i)) for i in range(3)
+        ]
+        await asyncio.gather(*tasks)
+        self.assertEqual([name.split()[0] for name in order], ["reply"] * 3 + ["notice"] * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()